@@ -0,0 +1,114 @@
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_INTERVAL_MS = 16  # ~60 fps
+
+
+class Cancelled(BaseException):
+    pass
+
+
+class Task:
+    """Handle for one background run; checked between stages so a newer run can cancel it."""
+
+    def __init__(self, name):
+        self.name = name
+        self.cancel_event = threading.Event()
+        self.started = time.perf_counter()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled()
+
+
+class BackgroundRunner:
+    """Runs pipeline work off the Tk main thread.
+
+    Work is submitted to a single background thread, so runs never overlap
+    and the analysis engine is only touched from one thread. Anything that
+    must update widgets is posted to a queue that the main thread drains via
+    after(); results of a run that has since been cancelled are dropped.
+    """
+
+    def __init__(self, after, on_status=None):
+        self.after = after  # e.g. root.after
+        self.on_status = on_status
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline")
+        self.ui_queue = queue.Queue()
+        self.current = None
+        self.pending = 0  # Submitted runs that have not finished yet
+        self.polling = False
+
+    def submit(self, name, work, on_done):
+        """Run work(task) in the background and call on_done(result) on the main thread.
+
+        Starting a run cancels the one in flight.
+        """
+        if self.current is not None:
+            self.current.cancel()
+        task = self.current = Task(name)
+        self.status(task, f"{name}: queued")
+        self.pending += 1
+        self.executor.submit(self._run, task, work, on_done)
+        self._start_polling()
+        return task
+
+    def status(self, task, text):
+        """Report progress of task; safe to call from any thread."""
+        self.post(task, self._show_status, text)
+
+    def post(self, task, callback, *args):
+        """Call callback(*args) on the main thread unless task has been cancelled by then."""
+        self.ui_queue.put((task, callback, args))
+
+    def _run(self, task, work, on_done):
+        try:
+            if task.cancelled:
+                return
+            result = work(task)
+            elapsed = (time.perf_counter() - task.started) * 1000
+            self.post(task, on_done, result)
+            self.status(task, f"{task.name}: done in {elapsed:.0f} ms")
+        except Cancelled:
+            pass
+        finally:
+            self.ui_queue.put((None, self._finished, ()))
+
+    def _finished(self):
+        self.pending -= 1
+
+    def _show_status(self, text):
+        if self.on_status:
+            self.on_status(text)
+
+    def _start_polling(self):
+        if not self.polling:
+            self.polling = True
+            self.after(POLL_INTERVAL_MS, self._poll)
+
+    def _poll(self):
+        while True:
+            try:
+                task, callback, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            if task is None or not task.cancelled:
+                callback(*args)
+        if self.pending == 0:
+            self.polling = False
+            return
+        self.after(POLL_INTERVAL_MS, self._poll)
+
+    def shutdown(self):
+        if self.current is not None:
+            self.current.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
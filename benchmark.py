@@ -0,0 +1,305 @@
+import gc
+import ast
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+from lexer import lexer
+from parser_module import parser
+from semantic import semantic_analyzer, SemanticPass
+from ir_generator import generate_ir, IRPass
+from visitor import FusedVisitor
+from optimizer import optimize
+from incremental import IncrementalEngine
+from execution import run_code
+from vm import run_program
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+KINDS = ["mixed", "functions", "nested", "strings"]
+DEFAULT_REGRESSION_THRESHOLD = 0.10  # Slowdown (as a fraction of the baseline median) reported as a regression
+
+
+# Synthetic programs. Each generator returns about `lines` lines of valid code
+# that runs quickly, so every stage (including execution) can be measured.
+def _mixed(rng, lines, depth):
+    out = ["total = 0"]
+    while len(out) < lines:
+        n = len(out)
+        choice = rng.randrange(4)
+        if choice == 0:
+            out.append(f"v{n} = {rng.randint(0, 999)} + {rng.randint(1, 999)} * {rng.randint(0, 99)}")
+        elif choice == 1:
+            out.append(f"total = total + {rng.randint(0, 9)}")
+        elif choice == 2:
+            out.append(f"if total > {rng.randint(0, 10000)}:")
+            out.append(f"    total = total - {rng.randint(0, 9)}")
+        else:
+            out.append(f"w{n} = len(str(total)) # comment {n}")
+    out.append("print(total)")
+    return out
+
+
+def _functions(rng, lines, depth):
+    out = []
+    count = 0
+    while len(out) < lines:
+        out.append(f"def f{count}(a, b):")
+        out.append(f"    c = a * {rng.randint(1, 9)} + b")
+        out.append(f"    if c > {rng.randint(0, 100)}:")
+        out.append("        return c - a")
+        out.append("    return c")
+        out.append(f"r{count} = f{count}({rng.randint(0, 50)}, {rng.randint(0, 50)})")
+        count += 1
+    out.append(f"print(r{count - 1})")
+    return out
+
+
+def _nested(rng, lines, depth):
+    out = ["x = 1"]
+    block = 0
+    while len(out) < lines:
+        for level in range(depth):
+            indent = "    " * level
+            if level % 2:
+                out.append(f"{indent}for i{block}_{level} in range(1):")
+            else:
+                out.append(f"{indent}if x > {-level}:")
+        inner = "    " * depth
+        value = "x"
+        for _ in range(depth):  # Deeply nested expression too
+            value = f"({value} + 1)"
+        out.append(f"{inner}y{block} = {value} - {depth}")
+        block += 1
+    out.append(f"print(y{block - 1})")
+    return out
+
+
+def _strings(rng, lines, depth):
+    words = ["alpha", "beta", "gamma", "delta", "lambda", "omega", "kappa", "sigma"]
+    out = []
+    while len(out) < lines:
+        n = len(out)
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(1, 12)))
+        quote = rng.choice(["'", '"'])
+        if n % 50 == 0:
+            out.append(f's{n} = """{text}\n{text}"""')
+        else:
+            out.append(f"s{n} = {quote}{text} #{n}{quote} + {quote}\\t{quote}")
+    out.append("print(len(s0))")
+    return out
+
+
+GENERATORS = {"mixed": _mixed, "functions": _functions, "nested": _nested, "strings": _strings}
+
+
+def generate_source(kind, lines, seed=0, depth=16):
+    """Generate a synthetic program of about `lines` lines; the same arguments always give the same source."""
+    return "\n".join(GENERATORS[kind](random.Random(f"{kind}-{lines}-{seed}"), lines, depth)) + "\n"
+
+
+class _NodeVisitorPass(ast.NodeVisitor):
+    """Runs one AnalysisPass with ast.NodeVisitor's own recursive walk, the baseline for the fused walk."""
+
+    def __init__(self, analysis_pass):
+        self.analysis_pass = analysis_pass
+        self.enter = analysis_pass.handler_names("visit_")
+        self.leave = analysis_pass.handler_names("leave_")
+        self.fields = analysis_pass.field_handler_names()
+
+    def visit(self, node):
+        node_type = type(node)
+        if node_type in self.enter:
+            getattr(self.analysis_pass, self.enter[node_type])(node)
+        hooks = self.fields.get(node_type, {})
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        self.visit(item)
+            elif isinstance(value, ast.AST):
+                self.visit(value)
+            if field in hooks:
+                getattr(self.analysis_pass, hooks[field])(node)
+        if node_type in self.leave:
+            getattr(self.analysis_pass, self.leave[node_type])(node)
+
+
+def _fused_walk(tree):
+    FusedVisitor([SemanticPass(), IRPass()]).walk(tree)
+
+
+def _separate_walks(tree):
+    _NodeVisitorPass(SemanticPass()).visit(tree)
+    _NodeVisitorPass(IRPass()).visit(tree)
+
+
+# Each stage: (prepare, run). prepare(code) builds the stage input outside the timed region.
+STAGES = {
+    "lex": (lambda code: code, lambda code: lexer(None, code)),
+    "parse": (lambda code: code, parser),
+    "semantic": (parser, semantic_analyzer),
+    "ir": (parser, generate_ir),
+    # Semantic analysis and IR generation without finish(): one fused walk, and one ast.NodeVisitor walk each
+    "fused": (parser, _fused_walk),
+    "separate": (parser, _separate_walks),
+    "optimize": (lambda code: generate_ir(parser(code)), optimize),
+    "incremental": (lambda code: code, lambda code: IncrementalEngine().update(code)),
+    "vm": (lambda code: optimize(generate_ir(parser(code)))[0], run_program),
+    "run": (lambda code: code, run_code),  # Runs in a worker process, so memory is not traced
+}
+IN_PROCESS_STAGES = set(STAGES) - {"run"}
+
+
+def time_stage(run, argument, repeat, warmup):
+    for _ in range(warmup):
+        run(argument)
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run(argument)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def peak_memory(run, argument):
+    """Peak bytes allocated by one call of run, measured separately since tracing slows it down."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(argument)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark(stages, kinds, sizes, repeat=5, warmup=1, depth=16, memory=True, log=None):
+    results = []
+    for kind in kinds:
+        for lines in sizes:
+            code = generate_source(kind, lines, depth=depth)
+            for stage in stages:
+                prepare, run = STAGES[stage]
+                argument = prepare(code)
+                timings = time_stage(run, argument, repeat, warmup)
+                median = statistics.median(timings)
+                result = {
+                    "stage": stage,
+                    "kind": kind,
+                    "lines": lines,
+                    "bytes": len(code.encode("utf-8")),
+                    "repeat": repeat,
+                    "warmup": warmup,
+                    "min": min(timings),
+                    "median": median,
+                    "mean": statistics.fmean(timings),
+                    "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+                    "lines_per_second": lines / median if median else None,
+                    "peak_memory": peak_memory(run, argument) if memory and stage in IN_PROCESS_STAGES else None,
+                }
+                results.append(result)
+                if log:
+                    log(result)
+                del argument
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata():
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+    }
+
+
+def compare(baseline, current, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """Match results by (stage, kind, lines) and return (rows, regressions); rows are (key, old, new, change)."""
+    old = {(r["stage"], r["kind"], r["lines"]): r for r in baseline["results"]}
+    rows = []
+    regressions = []
+    for result in current["results"]:
+        key = (result["stage"], result["kind"], result["lines"])
+        if key not in old:
+            continue
+        change = result["median"] / old[key]["median"] - 1 if old[key]["median"] else 0.0
+        rows.append((key, old[key]["median"], result["median"], change))
+        if change > threshold:
+            regressions.append(key)
+    return rows, regressions
+
+
+def format_result(result):
+    memory = f"{result['peak_memory'] / 1e6:10.1f} MB" if result["peak_memory"] is not None else f"{'-':>13}"
+    return (f"{result['stage']:<12}{result['kind']:<10}{result['lines']:>9}"
+            f"{result['median'] * 1000:>12.2f} ms{result['stdev'] * 1000:>10.2f} ms{memory}")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Benchmark every stage of the Python Mini Compiler pipeline.")
+    arg_parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated stages to time")
+    arg_parser.add_argument("--kinds", default=",".join(KINDS), help="comma-separated synthetic program kinds")
+    arg_parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                            help="comma-separated program sizes in lines (e.g. 1000,10000,1000000)")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="timed runs per measurement")
+    arg_parser.add_argument("--warmup", type=int, default=1, help="untimed runs before measuring")
+    arg_parser.add_argument("--depth", type=int, default=16, help="block nesting depth of the 'nested' programs")
+    arg_parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory run")
+    arg_parser.add_argument("-o", "--output", help="write the JSON results here")
+    arg_parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare with")
+    arg_parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                            help="median slowdown reported as a regression (default: 0.10 = 10%%)")
+    args = arg_parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    kinds = [kind.strip() for kind in args.kinds.split(",") if kind.strip()]
+    unknown = (set(stages) - set(STAGES)) | (set(kinds) - set(KINDS))
+    if unknown:
+        arg_parser.error(f"unknown stage(s) or kind(s): {', '.join(sorted(unknown))}")
+    try:
+        sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    except ValueError:
+        arg_parser.error("--sizes must be comma-separated integers")
+    if args.repeat < 1:
+        arg_parser.error("--repeat must be at least 1")
+
+    print(f"{'stage':<12}{'kind':<10}{'lines':>9}{'median':>15}{'stdev':>13}{'peak memory':>13}", file=sys.stderr)
+    results = benchmark(stages, kinds, sizes, args.repeat, args.warmup, args.depth, not args.no_memory,
+                        log=lambda result: print(format_result(result), file=sys.stderr))
+    report = {"meta": metadata(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        rows, regressions = compare(baseline, report, args.threshold)
+        print(f"\nCompared with {args.compare} (commit {baseline['meta'].get('commit')}):", file=sys.stderr)
+        for (stage, kind, lines), old, new, change in rows:
+            flag = "  REGRESSION" if (stage, kind, lines) in regressions else ""
+            print(f"{stage:<12}{kind:<10}{lines:>9}{old * 1000:>12.2f} ms ->{new * 1000:>10.2f} ms"
+                  f"{change * 100:>+9.1f}%{flag}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
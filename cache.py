@@ -0,0 +1,141 @@
+import gc
+import os
+import pickle
+import hashlib
+import tempfile
+from incremental import IncrementalEngine
+
+# Bump whenever the output of any pipeline stage changes so old entries are ignored
+PIPELINE_VERSION = "7"
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "python_mini_compiler")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class StageCache:
+    """Content-addressed on-disk cache of pipeline stage outputs.
+
+    Entries are keyed by a hash of the source plus PIPELINE_VERSION and hold
+    the pickled IncrementalEngine state for that source: tokens, per-statement
+    ASTs, semantic errors/warnings and IR. Reading an entry marks it as
+    recently used; once the directory grows past max_bytes the least recently
+    used entries are evicted. Eviction works on a fresh scan of the
+    directory, as other processes may share it; with auto_evict False put()
+    never evicts, so processes writing at once can leave it to a single
+    evict() call when they are done.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, auto_evict=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.auto_evict = auto_evict
+        self.sizes = None  # path -> size, scanned on first write; may miss other processes' writes
+
+    def key(self, code):
+        return hashlib.sha256(f"{PIPELINE_VERSION}\0{code}".encode("utf-8", "surrogatepass")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pickle")
+
+    def get(self, code):
+        path = self.path(self.key(code))
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            gc.disable()  # Unpickling large ASTs otherwise triggers repeated collections
+            try:
+                value = pickle.loads(data)
+            finally:
+                gc.enable()
+            os.utime(path)  # Mark as recently used
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Corrupt or incompatible entry: drop it and recompute
+            self._remove(path)
+            return None
+
+    def __contains__(self, code):
+        return os.path.exists(self.path(self.key(code)))
+
+    def put(self, code, value):
+        path = self.path(self.key(code))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except BaseException:
+            self._remove(temp_path)
+            raise
+
+        if self.auto_evict:
+            self._scan()
+            self.sizes[path] = os.path.getsize(path)
+            if sum(self.sizes.values()) > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        self.sizes = None  # Rescan: entries may have been added or removed since
+        self._scan()
+        total = sum(self.sizes.values())
+        if total <= self.max_bytes:
+            return
+
+        def last_used(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0
+
+        for path in sorted(self.sizes, key=last_used):
+            if total <= self.max_bytes:
+                break
+            total -= self.sizes.pop(path)
+            self._remove(path)
+
+    def clear(self):
+        self._scan()
+        for path in list(self.sizes):
+            self._remove(path)
+        self.sizes = {}
+
+    def _scan(self):
+        if self.sizes is not None:
+            return
+        self.sizes = {}
+        if not os.path.isdir(self.directory):
+            return
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(".pickle"):
+                        try:
+                            self.sizes[entry.path] = entry.stat().st_size
+                        except OSError:  # Evicted by another process meanwhile
+                            pass
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def analyze_source(code, cache=None):
+    """Run the lexer, parser, semantic analysis and IR stages, reusing cached outputs when present.
+
+    Returns the IncrementalResult; usable without the GUI.
+    """
+    engine = cache.get(code) if cache is not None else None
+    if engine is None:
+        engine = IncrementalEngine()
+        result = engine.update(code)
+        if cache is not None:
+            cache.put(code, engine)
+        return result
+    return engine.update(code)
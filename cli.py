@@ -0,0 +1,176 @@
+import os
+import sys
+import glob
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from lexer import tokenize
+from parser_module import parser
+from semantic import SemanticPass
+from ir_generator import IRPass
+from optimizer import optimize
+from visitor import run_passes
+from cache import StageCache, DEFAULT_CACHE_DIR, analyze_source
+
+STAGES = ["lex", "parse", "semantic", "ir", "opt"]
+
+# Set in each worker process by _init_worker
+_stages = STAGES
+_cache = None
+
+
+def expand_paths(patterns):
+    """Expand files, directories (recursively, *.py only) and glob patterns into a sorted list of files."""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for folder, _, files in os.walk(pattern):
+                paths.update(os.path.join(folder, name) for name in files if name.endswith(".py"))
+        elif glob.has_magic(pattern):
+            paths.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        else:
+            paths.add(pattern)
+    return sorted(paths)
+
+
+def _init_worker(stages, cache_dir):
+    global _stages, _cache
+    _stages = stages
+    _cache = StageCache(cache_dir, auto_evict=False) if cache_dir else None  # main() evicts once at the end
+
+
+def _format_invalid_token(token):
+    return {"token": token.value, "line": token.line, "column": token.column}
+
+
+def _format_syntax_error(e):
+    return {"message": e.msg, "line": e.lineno, "column": e.offset}
+
+
+def _optimize(program):
+    optimized, stats = optimize(program)
+    return {
+        "optimized_ir": optimized.lines(),
+        "optimization": {
+            "instructions_before": len(program),
+            "instructions_after": len(optimized),
+            "passes": [stats_row._asdict() for stats_row in stats],
+        },
+    }
+
+
+def compile_source(code, stages=STAGES, cache=None):
+    """Run the selected stages on code and return a JSON-serializable dict of their outputs."""
+    output = {}
+    if cache is not None:
+        # The cache holds every stage's output, so read whichever ones were asked for
+        result = analyze_source(code, cache)
+        syntax_error = result.syntax_error
+        if "lex" in stages:
+            output["tokens"] = result.tokens
+            output["invalid_tokens"] = [_format_invalid_token(t) for t in result.invalid_token_positions()]
+        if "parse" in stages or syntax_error:
+            output["syntax_error"] = _format_syntax_error(syntax_error) if syntax_error else None
+        if syntax_error is None:
+            if "semantic" in stages:
+                output["errors"], output["warnings"] = result.errors, result.warnings
+            if "ir" in stages:
+                output["ir"] = result.ir_code.split("\n") if result.ir_code else []
+            if "opt" in stages:
+                output.update(_optimize(result.ir))
+        return output
+
+    if "lex" in stages:
+        tokens = list(tokenize(code))
+        output["tokens"] = [t.value for t in tokens if t.kind != "INVALID"]
+        output["invalid_tokens"] = [_format_invalid_token(t) for t in tokens if t.kind == "INVALID"]
+    if not {"parse", "semantic", "ir", "opt"} & set(stages):
+        return output
+
+    try:
+        tree = parser(code)
+    except SyntaxError as e:
+        output["syntax_error"] = _format_syntax_error(e)
+        return output
+    if "parse" in stages:
+        output["syntax_error"] = None
+
+    # Semantic analysis and IR generation share one tree walk
+    passes = []
+    if "semantic" in stages:
+        passes.append(SemanticPass())
+    if "ir" in stages or "opt" in stages:
+        passes.append(IRPass())
+    results = run_passes(tree, passes)
+    if "semantic" in stages:
+        output["errors"], output["warnings"] = results.pop(0)
+    if results:
+        program = results.pop(0)
+        if "ir" in stages:
+            output["ir"] = program.lines()
+        if "opt" in stages:
+            output.update(_optimize(program))
+    return output
+
+
+def compile_file(path):
+    record = {"path": path}
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            code = file.read()
+        record.update(compile_source(code, _stages, _cache))
+    except (OSError, UnicodeDecodeError) as e:
+        record["error"] = str(e)
+    except (MemoryError, RecursionError, ValueError) as e:  # e.g. nesting too deep for the parser
+        record["error"] = str(e) or type(e).__name__
+    record["ok"] = not (record.get("error") or record.get("invalid_tokens")
+                        or record.get("syntax_error") or record.get("errors"))
+    return record
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Run the Python Mini Compiler pipeline over files without the GUI and print JSON lines.")
+    arg_parser.add_argument("paths", nargs="+", help="files, directories or glob patterns")
+    arg_parser.add_argument("--stages", default=",".join(STAGES),
+                            help=f"comma-separated stages to run (default: {','.join(STAGES)})")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    arg_parser.add_argument("--chunksize", type=int, default=16, help="files handed to a worker at a time")
+    arg_parser.add_argument("--cache", nargs="?", const=DEFAULT_CACHE_DIR, default=None,
+                            help="reuse stage outputs from the on-disk cache (optionally at this directory)")
+    arg_parser.add_argument("-o", "--output", help="write JSON lines here instead of stdout")
+    args = arg_parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        arg_parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+
+    paths = expand_paths(args.paths)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    failed = 0
+    try:
+        if args.jobs <= 1:
+            _init_worker(stages, args.cache)
+            records = map(compile_file, paths)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(args.jobs, initializer=_init_worker, initargs=(stages, args.cache))
+            records = executor.map(compile_file, paths, chunksize=max(args.chunksize, 1))
+        for record in records:
+            failed += not record["ok"]
+            out.write(json.dumps(record) + "\n")
+        if executor is not None:
+            executor.shutdown()
+        if args.cache:
+            StageCache(args.cache).evict()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"{len(paths)} file(s), {failed} with errors", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,454 @@
-import ast
+import io
+import os
+import sys
+import time
+import queue
+import pickle
+import struct
+import marshal
+import tempfile
+import atexit
+import builtins
+import threading
+import traceback
 import subprocess
+from collections import deque, namedtuple
 
-def run_code(code):
+DEFAULT_TIMEOUT = 5  # Seconds per job
+DEFAULT_MEMORY_LIMIT = 512 * 1024 * 1024  # Bytes of address space per worker
+DEFAULT_MAX_JOBS = 50  # Jobs a worker runs before it is replaced
+CANCEL_POLL_INTERVAL = 0.05  # Seconds between checks for cancellation while a job runs
+DEFAULT_MAX_OUTPUT_LINES = 10000  # Output lines kept by run_code; older lines are dropped
+FLUSH_INTERVAL = 0.05  # Seconds a worker may hold back buffered output
+# Imported by each worker up front, so jobs using them leave it clean (see _restore_modules)
+WARM_MODULES = ("math", "heapq", "bisect", "itertools", "functools", "collections", "re", "string", "random")
+
+# peak_rss is the most memory (bytes) the job's process held, where the platform can tell
+ExecutionResult = namedtuple("ExecutionResult", ["stdout", "stderr", "exit_code", "timed_out", "duration", "peak_rss"],
+                             defaults=(None,))
+
+_HEADER = struct.Struct("!I")
+
+
+def _send(stream, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def _receive(stream):
+    header = stream.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise EOFError("worker pipe closed")
+    (length,) = _HEADER.unpack(header)
+    return pickle.loads(stream.read(length))
+
+
+class OutputBuffer:
+    """Thread-safe ring buffer of output lines, each tagged with its stream name.
+
+    Only the last max_lines complete lines are kept (all of them if max_lines
+    is None); `dropped` counts the lines that fell out of the buffer. A line
+    still missing its newline is held back until it is completed or the
+    buffer is closed.
+    """
+
+    def __init__(self, max_lines=None):
+        self.lines = deque(maxlen=max_lines)
+        self.partial = {}  # stream name -> unterminated last line
+        self.dropped = 0
+        self.closed = False  # Set once the writer has finished
+        self.lock = threading.Lock()
+
+    def write(self, stream, text):
+        with self.lock:
+            text = self.partial.pop(stream, "") + text
+            new_lines = text.splitlines(keepends=True)
+            if new_lines and not new_lines[-1].endswith(("\n", "\r")):
+                self.partial[stream] = new_lines.pop()
+            if self.lines.maxlen is not None:
+                self.dropped += max(len(self.lines) + len(new_lines) - self.lines.maxlen, 0)
+            self.lines.extend((stream, line) for line in new_lines)
+
+    def close(self):
+        with self.lock:
+            self.lines.extend(self.partial.items())
+            self.partial = {}
+            self.closed = True
+
+    def take(self):
+        """Remove and return the buffered (stream, line) pairs and the number of lines dropped since the last take."""
+        with self.lock:
+            lines, dropped = list(self.lines), self.dropped
+            self.lines.clear()
+            self.dropped = 0
+        return lines, dropped
+
+    def text(self, stream):
+        with self.lock:
+            text = "".join(line for name, line in self.lines if name == stream) + self.partial.get(stream, "")
+            dropped = self.dropped
+        return (truncation_marker(dropped) + text) if dropped else text
+
+
+def truncation_marker(dropped):
+    return f"[... truncated {dropped} lines ...]\n"
+
+
+class _StreamWriter(io.TextIOBase):
+    """sys.stdout/sys.stderr replacement that forwards output to the parent in batches."""
+
+    def __init__(self, channel, lock, name, flush_size=8192):
+        self.channel = channel
+        self.lock = lock  # Shared by all writers of the channel
+        self.name = name
+        self.flush_size = flush_size
+        self.buffer = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        with self.lock:
+            self.buffer.append(text)
+            self.size += len(text)
+            if self.size >= self.flush_size:
+                self._flush()
+        return len(text)
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            _send(self.channel, (self.name, "".join(self.buffer)))
+            self.buffer = []
+            self.size = 0
+
+
+def _flush_periodically(writers):
+    # Output written just before a long computation still reaches the parent promptly
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        for writer in list(writers):
+            writer.flush()
+
+
+def _limit_memory(memory_limit):
     try:
-        result = subprocess.run(
-            ["python", "-c", code],  
-            capture_output=True,
-            text=True,
-            timeout=5  
+        import resource
+    except ImportError:  # Not available on Windows
+        return
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def _reset_peak_rss():
+    # Linux only: restart the process's high-water mark (VmHWM) so it covers one job
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss(reset):
+    if reset:
+        try:
+            with open("/proc/self/status") as file:
+                for line in file:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Since the worker started
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _snapshot_modules():
+    return {name: (module, dict(module.__dict__)) for name, module in list(sys.modules.items())
+            if hasattr(module, "__dict__")}
+
+
+def _restore_modules(snapshot, recursion_limit):
+    """Undo a job's rebinding of module attributes, builtins included.
+
+    Returns False when the job imported modules of its own, whose state
+    cannot be undone; the worker must then be replaced.
+    """
+    for name, (module, attributes) in snapshot.items():
+        namespace = module.__dict__
+        if namespace == attributes:  # Compares identical values by identity, in C
+            continue
+        for key in namespace.keys() - attributes.keys():
+            del namespace[key]
+        for key, value in attributes.items():
+            if namespace.get(key, namespace) is not value:
+                namespace[key] = value
+    for name, (module, _) in snapshot.items():
+        if sys.modules.get(name) is not module:
+            sys.modules[name] = module
+    sys.setrecursionlimit(recursion_limit)
+    return sys.modules.keys() <= snapshot.keys()
+
+
+def _worker_main(memory_limit):
+    # The protocol owns the original stdin/stdout; user code never sees them
+    requests = os.fdopen(os.dup(0), "rb")
+    channel = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    _limit_memory(memory_limit)
+    lock = threading.Lock()
+    writers = []
+    threading.Thread(target=_flush_periodically, args=(writers,), daemon=True).start()
+    for name in WARM_MODULES:
+        __import__(name)
+    from vm import run_program
+    clean = _snapshot_modules()
+    recursion_limit = sys.getrecursionlimit()
+    with lock:
+        _send(channel, ("ready", None))
+
+    while True:
+        try:
+            code, stdin = _receive(requests)
+        except EOFError:
+            return
+        reset = _reset_peak_rss()
+        stdout = sys.stdout = _StreamWriter(channel, lock, "stdout")
+        stderr = sys.stderr = _StreamWriter(channel, lock, "stderr")
+        writers[:] = [stdout, stderr]
+        # The input is a real file on fd 0, so sys.stdin.buffer and open(0) read it too
+        with tempfile.TemporaryFile() as file:
+            file.write(stdin.encode("utf-8"))
+            file.seek(0)
+            os.dup2(file.fileno(), 0)
+        stdin_reader = sys.stdin = open(0, "r", encoding="utf-8", closefd=False)
+        exit_code = 0
+        try:
+            if isinstance(code, (str, bytes)):
+                # Source, or a code object compiled once by the parent (see compile_program)
+                program = marshal.loads(code) if isinstance(code, bytes) else compile(code, "<string>", "exec")
+                exec(program, {"__name__": "__main__", "__builtins__": builtins})
+            else:  # An IRProgram for the VM, which reports its own errors; the parent enforces the timeout
+                streams = {"stdout": stdout, "stderr": stderr}
+                exit_code = run_program(code, stdin=stdin, on_output=lambda name, text: streams[name].write(text),
+                                        max_output_lines=0, timeout=None).exit_code
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            if e.code is not None and not isinstance(e.code, int):
+                print(e.code, file=stderr)
+        except BaseException as e:
+            # Drop this function's frame so tracebacks read like `python -c`
+            stderr.write("Traceback (most recent call last):\n" if e.__traceback__.tb_next else "")
+            stderr.write("".join(traceback.format_tb(e.__traceback__.tb_next)))
+            stderr.write("".join(traceback.format_exception_only(type(e), e)))
+            exit_code = 1
+        finally:
+            stdout.flush()
+            stderr.flush()
+            stdin_reader.close()
+            sys.stdin, sys.stdout, sys.stderr = sys.__stdin__, sys.__stdout__, sys.__stderr__
+            os.dup2(devnull, 0)
+            # Jobs share the interpreter, so the next one must not see this one's print = ... or math.pi = ...
+            reusable = _restore_modules(clean, recursion_limit)
+        with lock:
+            writers[:] = []
+            _send(channel, ("done", (exit_code, _peak_rss(reset), reusable)))
+
+
+def compile_program(code):
+    """Compile code once for running many times with WorkerPool.run; raises SyntaxError.
+
+    Workers run the same interpreter, so the marshalled code object loads there as is.
+    """
+    return marshal.dumps(compile(code, "<string>", "exec"))
+
+
+class _Worker:
+    def __init__(self, memory_limit):
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", os.path.abspath(__file__), "--worker", str(memory_limit or 0)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
         )
-        output = result.stdout if result.stdout else result.stderr
+        self.jobs = 0
+        self.ready = False
+        self.messages = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        try:
+            while True:
+                self.messages.put(_receive(self.process.stdout))
+        except (EOFError, OSError, pickle.UnpicklingError):
+            self.messages.put(("exit", self.process.poll()))
+
+    def wait_ready(self, timeout):
+        if not self.ready:
+            kind, _ = self.messages.get(timeout=timeout)
+            self.ready = kind == "ready"
+        return self.ready
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+
+class WorkerPool:
+    """Pool of pre-started interpreter processes that execute code on demand.
+
+    Each job runs in a fresh namespace inside a warm worker, so no interpreter
+    start-up is paid per run. Jobs are limited by a timeout and the worker's
+    address space limit. Changes a job makes to builtins and module attributes
+    are undone after it; a worker is replaced after max_jobs jobs, after a job
+    that imported modules WARM_MODULES does not cover, after a timeout or when
+    it crashes.
+    """
+
+    def __init__(self, size=2, timeout=DEFAULT_TIMEOUT, memory_limit=DEFAULT_MEMORY_LIMIT, max_jobs=DEFAULT_MAX_JOBS):
+        self.size = size
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_jobs = max_jobs
+        self.idle = queue.Queue()
+        self.closed = False
+        for _ in range(size):
+            self.idle.put(self._start_worker())
+
+    def _start_worker(self):
+        return _Worker(self.memory_limit)
+
+    def run(self, code, timeout=None, on_output=None, cancel=None, max_output_lines=None, stdin=""):
+        """Execute code in a worker and return an ExecutionResult.
+
+        code is source, compile_program() output or an (optimized) IRProgram
+        that vm.supports(), which the worker runs on the VM.
+
+        The program reads stdin as its standard input. on_output(stream_name,
+        text) is called with batches of output as the program produces them.
+        Setting the threading.Event cancel stops the job and replaces its
+        worker. With max_output_lines only the last lines of each stream are
+        kept in the result, after a truncation marker.
+        """
+        if self.closed:
+            raise RuntimeError("worker pool is closed")
+        timeout = self.timeout if timeout is None else timeout
+        worker = self.idle.get()
+        output = {"stdout": OutputBuffer(max_output_lines), "stderr": OutputBuffer(max_output_lines)}
+        exit_code = None
+        peak_rss = None
+        timed_out = False
+        reusable = False
+        start = time.perf_counter()
+        try:
+            try:
+                if not worker.alive() or not worker.wait_ready(timeout):
+                    raise RuntimeError("worker failed to start")
+            except (queue.Empty, RuntimeError):
+                worker.kill()
+                worker = self._start_worker()
+                try:
+                    worker.wait_ready(timeout)
+                except queue.Empty:
+                    pass  # Its "ready" may still be on the way; the loop below skips it
+
+            start = time.perf_counter()
+            deadline = start + timeout
+            try:
+                _send(worker.process.stdin, (code, stdin))
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        output["stderr"].write("stderr", "Execution cancelled")
+                        break
+                    remaining = max(deadline - time.perf_counter(), 0)
+                    try:
+                        kind, payload = worker.messages.get(timeout=min(remaining, CANCEL_POLL_INTERVAL))
+                    except queue.Empty:
+                        if remaining > CANCEL_POLL_INTERVAL:
+                            continue
+                        raise
+                    if kind == "ready":
+                        worker.ready = True
+                        continue
+                    if kind == "done":
+                        exit_code, peak_rss, reusable = payload
+                        break
+                    if kind == "exit":  # Crashed, e.g. killed by the memory limit
+                        exit_code = payload if payload is not None else -1
+                        output["stderr"].write("stderr", "Execution Error: worker process exited unexpectedly")
+                        break
+                    output[kind].write(kind, payload)
+                    if on_output:
+                        on_output(kind, payload)
+            except queue.Empty:
+                timed_out = True
+            except OSError as e:
+                output["stderr"].write("stderr", f"Execution Error: {e}")
+        finally:
+            duration = time.perf_counter() - start
+            # The worker always goes back, or is replaced, so the pool never shrinks
+            worker.jobs += 1
+            if not reusable or not worker.alive() or worker.jobs >= self.max_jobs:
+                worker.kill()
+                worker = self._start_worker()
+            self.idle.put(worker)
+
+        return ExecutionResult(output["stdout"].text("stdout"), output["stderr"].text("stderr"), exit_code, timed_out, duration,
+                               peak_rss)
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = WorkerPool()
+            atexit.register(_default_pool.close)
+        return _default_pool
+
+
+def run_code(code, cancel=None):
+    try:
+        result = get_pool().run(code, cancel=cancel, max_output_lines=DEFAULT_MAX_OUTPUT_LINES)
+        if result.timed_out:
+            output = f"Execution Error: timed out after {get_pool().timeout} seconds"
+        else:
+            output = result.stdout if result.stdout else result.stderr
     except Exception as e:
         output = f"Execution Error: {str(e)}"
-    
+
     return output.strip()
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--worker"]:
+    _worker_main(int(sys.argv[2]))
@@ -1,19 +1,90 @@
-import re, sys, ast, io, subprocess
+import os, re
 import tkinter as tk
 from tkinter import filedialog, simpledialog, messagebox
-from semantic import semantic_analyzer
-from ir_generator import generate_ir
-from execution import run_code
+from optimizer import optimize, format_stats
+from execution import get_pool, OutputBuffer, truncation_marker, DEFAULT_MAX_OUTPUT_LINES
+from vm import supports
+from lexer import lexer
+from parser_module import parser
+from incremental import IncrementalEngine
+from cache import StageCache
+from background import BackgroundRunner
+from profiling import Profiler, untimed
+from output_view import Document, IRLines, TokenLines
+from fileio import MappedSource, WriteBehindSaver, scan_tokens
+from search import SearchIndex
+from indexer import ProjectIndexer
+from live import LiveChecker, LIVE_DELAY_MS
+from grader import grade, load_cases, format_result, normalize_output
+
+
+STREAM_INTERVAL_MS = 50  # How often streamed program output is added to output_area
+LOAD_INTERVAL_MS = 1  # Pause between chunks inserted into text_area while a file loads
+SAVE_POLL_MS = 100  # How often finished background saves are checked for
+INDEX_POLL_MS = 500  # How often results of the folder indexer are applied
+PROFILED_STAGES = ["lex", "parse", "semantic", "optimize"]  # Stages cProfile can be enabled for
+
+# Color mappings for different IR instructions
+IR_COLORS = {
+    "STORE": "red",
+    "BINARY_OP": "yellow",
+    "UNARY_OP": "yellow",
+    "COMPARE": "yellow",
+    "LOAD_CONST": "blue",
+    "LOAD_VAR": "cyan",
+    "LOAD_GLOBAL": "cyan",
+    "LOAD_FREE": "cyan",
+    "STORE_GLOBAL": "red",
+    "CALL": "green",
+    "IF_START": "magenta",
+    "JUMP": "magenta",
+    "GET_ITER": "magenta",
+    "FOR_ITER": "magenta",
+    "RETURN": "gray",
+    "FUNCTION": "green",
+    "EVAL": "orange",
+    # Test case results (run_tests)
+    "PASS": "green",
+    "FAIL": "red",
+    "TIMEOUT": "red"
+}
 
 
 class CompilerFeatures:
+    lexer = lexer  # Shared single-pass tokenizer from lexer.py
+
     def __init__(self):
         self.unsaved_changes = False
         self.current_file = None
+        self.loading = None  # MappedSource being inserted into text_area
+        self.saver = WriteBehindSaver()
+        self.search = None  # SearchIndex of the last find, while the buffer is unchanged
+        self.search_text = None  # What was last searched for, to search again after edits
+        self.search_options = {"regex": False, "whole_word": False}
+        self.search_generation = None  # edit_generation the search was built at
+        self.edit_generation = 0  # Counts edits of text_area, to tell when a snapshot of it is stale
+        self.live_enabled = False
+        self.live_after = None  # Pending after() id of the debounced live analysis
+        # Live runs get their own thread, so typing never cancels a run started from a button
+        self.live_runner = BackgroundRunner(lambda ms, callback: self.root.after(ms, callback))
+        self.live_checker = LiveChecker()
+        self.highlighted = set()  # Indices of the search matches tagged so far
+        self.indexer = ProjectIndexer()  # Pre-analyzes the files of the open folder
+        self.engine = IncrementalEngine()
+        self.stage_cache = StageCache()
+        self.output_max_lines = DEFAULT_MAX_OUTPUT_LINES  # Older execution output is dropped
+        self.background = BackgroundRunner(lambda ms, callback: self.root.after(ms, callback), self.show_status)
+        self.profiler = None  # Profiler of the run in progress (runs never overlap)
+        self.last_profiler = None  # Profiler of the last finished run, for the timing panel and trace export
+        self.cprofile_stages = set()  # Stages to run under cProfile
 
     def on_text_change(self, event=None):
         self.unsaved_changes = True
 
+    def reset_analysis(self):
+        # A new buffer: the next analysis starts from the on-disk cache
+        self.engine = IncrementalEngine()
+
     def new_file(self):
         if self.unsaved_changes:
             response = messagebox.askyesnocancel("Unsaved Changes", "You have unsaved changes. Do you want to save?")
@@ -21,25 +92,128 @@ class CompilerFeatures:
                 self.save_file()
             elif response is None:  # User clicked 'Cancel'
                 return
+        self.stop_loading()
         self.text_area.delete(1.0, tk.END)  
+        self.reset_analysis()
         self.unsaved_changes = False
 
     def open_file(self):
         file_path = filedialog.askopenfilename(filetypes=[("Python Files", "*.py"), ("All Files", "*.*")])
         if file_path:
-            with open(file_path, "r") as file:
-                self.text_area.delete(1.0, tk.END)
-                self.text_area.insert(1.0, file.read())
-            self.current_file = file_path
+            try:
+                self.load_file(file_path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not open file: {e}")
+
+    def load_file(self, file_path):
+        # The file is memory-mapped and inserted a chunk per event loop turn, so even
+        # huge files keep the window responsive; it is lexed from the mapping meanwhile
+        source = MappedSource(file_path)
+        self.stop_loading()
+        self.text_area.delete(1.0, tk.END)
+        self.reset_analysis()
+        self.current_file = file_path
+        self.unsaved_changes = False
+        self.loading = source
+        self.insert_chunks(source, source.chunks())
+        if not self.show_indexed_diagnostics(file_path):  # Otherwise lex it now
+            self.background.submit(f"Scanning {os.path.basename(file_path)}",
+                                   lambda task: self.scan_file(file_path, task), self.show_scan)
+
+    def insert_chunks(self, source, chunks):
+        if source is not self.loading:  # Another file was opened, or the buffer cleared
+            return
+        try:
+            text, done = next(chunks)
+        except StopIteration:
+            self.stop_loading()
             self.unsaved_changes = False
-    
+            self.show_status(f"Loaded {source.path}")
+            return
+        except (OSError, UnicodeDecodeError) as e:
+            # Drop the partial text, or a later Save would truncate the file to it
+            self.stop_loading()
+            self.text_area.delete(1.0, tk.END)
+            self.reset_analysis()
+            self.current_file = None
+            self.unsaved_changes = False
+            messagebox.showerror("Error", f"Could not open file: {e}")
+            return
+        self.text_area.insert(tk.END, text)
+        self.show_status(f"Loading {os.path.basename(source.path)}: {done * 100 // source.size}%")
+        self.root.after(LOAD_INTERVAL_MS, self.insert_chunks, source, chunks)
+
+    def stop_loading(self):
+        if self.loading is not None:
+            self.loading.close()
+            self.loading = None
+
+    @staticmethod
+    def scan_file(file_path, task):
+        try:
+            return file_path, scan_tokens(file_path, task.check), None
+        except (OSError, ValueError) as e:
+            return file_path, None, e
+
+    def show_scan(self, result):
+        file_path, scan, error = result
+        name = os.path.basename(file_path)
+        if error is not None:
+            self.show_status(f"Could not scan {name}: {error}")
+            return
+        count, invalid = scan
+        self.show_status(f"{name}: {count} tokens, {len(invalid)} invalid")
+        if invalid:
+            self.display_output(Document([f"Invalid tokens in {name}:"],
+                                         [f"Line {token.line}, column {token.column}: {token.value!r}" for token in invalid]))
+
+    def watch_folder(self, folder):
+        polling = self.indexer.root is not None
+        self.indexer.watch(folder)
+        self.folder_list.delete(0, tk.END)
+        if not polling:
+            self.root.after(INDEX_POLL_MS, self.poll_index)
+
+    def poll_index(self):
+        if self.indexer.poll():
+            self.folder_list.delete(0, tk.END)
+            self.folder_list.insert(tk.END, *sorted(self.indexer.files))
+        self.root.after(INDEX_POLL_MS, self.poll_index)
+
+    def show_indexed_diagnostics(self, file_path):
+        # Files of the open folder are analyzed before they are opened; show that if it is current
+        if self.indexer.root is None:
+            return False
+        path = os.path.relpath(os.path.abspath(file_path), os.path.abspath(self.indexer.root))
+        if not self.indexer.is_current(path):
+            return False
+        errors, warnings = self.indexer.diagnostics(path)
+        self.display_output(Document([f"Pre-analysis of {path}:"], self.format_semantic(errors, warnings)))
+        return True
+
     def save_file(self):
-        if self.current_file:
-            with open(self.current_file, "w") as file:
-                file.write(self.text_area.get(1.0, tk.END).strip())
+        if self.loading is not None:  # Saving now would write a partial file over the whole one
+            messagebox.showinfo("Loading", "Wait until the file has finished loading before saving it.")
+        elif self.current_file:
+            # Written (temp file + rename) on the saver's thread; "end-1c" leaves out Tk's trailing newline
+            busy = self.saver.busy
+            self.saver.save(self.current_file, self.text_area.get(1.0, "end-1c"))
             self.unsaved_changes = False
+            if not busy:
+                self.root.after(SAVE_POLL_MS, self.poll_saves)
         else:
             self.save_file_as()
+
+    def poll_saves(self):
+        busy = self.saver.busy  # Read first: results of a save that finishes after this are seen next time
+        for file_path, error in self.saver.completed():
+            if error is not None:
+                self.unsaved_changes = True
+                messagebox.showerror("Error", f"Could not save file: {error}")
+            else:
+                self.show_status(f"Saved {file_path}")
+        if busy:
+            self.root.after(SAVE_POLL_MS, self.poll_saves)
     
     def save_file_as(self):
         file_path = filedialog.asksaveasfilename(defaultextension=".py", filetypes=[("Python Files", "*.py"), ("All Files", "*.*")])
@@ -47,156 +221,458 @@ class CompilerFeatures:
             self.current_file = file_path
             self.save_file()
     
+    def toggle_search_option(self, option):
+        self.search_options[option] = not self.search_options[option]
+
+    def build_search(self, pattern):
+        # The buffer is indexed once per search; Tk's modified flag tells when it goes stale
+        try:
+            search = SearchIndex(self.text_area.get("1.0", "end-1c"), pattern, **self.search_options)
+        except re.error as e:
+            messagebox.showerror("Error", f"Invalid pattern: {e}")
+            return None
+        self.search_generation = self.edit_generation
+        return search
+
     def find_text(self):
         find_str = simpledialog.askstring("Find", "Enter text to find:")
         if find_str:
-            self.text_area.tag_remove("highlight", "1.0", tk.END)
-            start_pos = "1.0"
-            while True:
-                start_pos = self.text_area.search(find_str, start_pos, stopindex=tk.END)
-                if not start_pos:
-                    break
-                end_pos = f"{start_pos}+{len(find_str)}c"
-                self.text_area.tag_add("highlight", start_pos, end_pos)
-                start_pos = end_pos
+            self.search_text = find_str
+            self.clear_highlights()
             self.text_area.tag_config("highlight", background="yellow")
-    
+            self.find_next()
+
+    def find_next(self, event=None):
+        if self.search_text is None:
+            return
+        if self.search is None or self.search_generation != self.edit_generation:
+            self.clear_highlights()
+            self.search = self.build_search(self.search_text)
+            if self.search is None:
+                return
+        search = self.search
+        cursor = search.offset(self.text_area.index("insert"))
+        index = search.next_after(cursor)
+        if index is None:
+            self.show_status(f"'{self.search_text}' not found")
+            return
+        if search.starts[index] == search.ends[index] == cursor:  # Step over an empty match at the cursor
+            index = search.next_after(cursor + 1)
+        start, end = search.span(index)
+        self.text_area.mark_set("insert", end)
+        self.text_area.see(start)
+        self.highlight_visible()
+        self.show_status(f"Match at line {start.split('.')[0]}")
+
+    def highlight_visible(self):
+        # Only matches on the lines in view are tagged; more are tagged as the view scrolls
+        search = self.search
+        if search is None:
+            return
+        if self.search_generation != self.edit_generation:  # Edited since the search: its offsets no longer apply
+            self.search = None
+            self.highlighted.clear()
+            return
+        first = int(self.text_area.index("@0,0").split(".")[0])
+        last = int(self.text_area.index(f"@0,{self.text_area.winfo_height()}").split(".")[0])
+        start = search.line_starts[first - 1]
+        stop = search.line_starts[last] if last < len(search.line_starts) else len(search.text)
+        for index in search.between(start, stop):
+            if index not in self.highlighted:
+                self.highlighted.add(index)
+                self.text_area.tag_add("highlight", *search.span(index))
+
+    def clear_highlights(self):
+        self.text_area.tag_remove("highlight", "1.0", tk.END)
+        self.highlighted.clear()
+        self.search = None
+
+    def on_text_scroll(self, first, last):
+        self.text_area.vbar.set(first, last)
+        if self.search is not None:
+            self.highlight_visible()
+
+    def on_modified(self, event=None):
+        # Runs on every edit: Tk reports a change of the modified flag, which is cleared again here
+        if not self.text_area.edit_modified():
+            return
+        self.text_area.edit_modified(False)
+        self.edit_generation += 1
+        if self.live_enabled:
+            if self.live_after is not None:
+                self.root.after_cancel(self.live_after)
+            self.live_after = self.root.after(LIVE_DELAY_MS, self.run_live_diagnostics)
+
+    def toggle_live_diagnostics(self):
+        self.live_enabled = not self.live_enabled
+        if self.live_after is not None:
+            self.root.after_cancel(self.live_after)
+            self.live_after = None
+        if self.live_enabled:
+            self.text_area.tag_config("live_error", underline=True, foreground="red")
+            self.run_live_diagnostics()
+        else:
+            self.text_area.tag_remove("live_error", "1.0", tk.END)
+
+    def run_live_diagnostics(self):
+        # The snapshot is analyzed in the checker process, so the Tk thread keeps the GIL; a newer one cancels it
+        self.live_after = None
+        if not self.live_enabled or self.loading is not None:
+            return
+        code = self.text_area.get("1.0", "end-1c")
+        generation = self.edit_generation
+        self.live_runner.submit("Live diagnostics", lambda task: self.live_checker.diagnose(code, task.check),
+                                lambda diagnostics: self.show_live_diagnostics(generation, diagnostics))
+
+    def show_live_diagnostics(self, generation, diagnostics):
+        if generation != self.edit_generation or not self.live_enabled:
+            return  # The text has changed since; its own run is on the way
+        self.text_area.tag_remove("live_error", "1.0", tk.END)
+        for line, column, end_line, end_column, message in diagnostics:
+            end = f"{end_line}.{end_column}" if (end_line, end_column) > (line, column) else f"{line}.{column}+1c"
+            self.text_area.tag_add("live_error", f"{line}.{column}", end)
+        if diagnostics:
+            line, column, _, _, message = diagnostics[0]
+            self.show_status(f"{len(diagnostics)} problem(s); line {line}, column {column + 1}: {message}")
+        else:
+            self.show_status("No problems found")
+
     def replace_text(self):
         find_str = simpledialog.askstring("Replace", "Enter text to find:")
         replace_str = simpledialog.askstring("Replace", "Enter replacement text:")
-        if find_str and replace_str:
-            content = self.text_area.get(1.0, tk.END)
-            content = content.replace(find_str, replace_str)
-            self.text_area.delete(1.0, tk.END)
-            self.text_area.insert(1.0, content)
+        if find_str and replace_str is not None:
+            self.clear_highlights()
+            search = self.build_search(find_str)
+            if search is None:
+                return
+            try:
+                edits = search.replacements(replace_str)
+            except (re.error, IndexError) as e:  # e.g. a reference to a group the pattern lacks
+                messagebox.showerror("Error", f"Invalid replacement: {e}")
+                return
+            # Each match is replaced in place, last first, so the rest of the buffer, the
+            # cursor and the undo history are left alone
+            self.text_area.edit_separator()
+            for start, end, new in edits:
+                start, end = search.position(start), search.position(end)
+                self.text_area.delete(start, end)
+                self.text_area.insert(start, new)
+            self.text_area.edit_separator()
+            if edits:
+                self.unsaved_changes = True
+            self.show_status(f"Replaced {len(edits)} occurrence(s)")
 
     def run_code(self):
         code = self.text_area.get("1.0", tk.END)  # Get code from text editor
         if not code.strip():
             messagebox.showerror("Error", "No code to run.")
             return
-        
+
+        # Output is streamed into output_area while the program runs
+        stream = OutputBuffer(self.output_max_lines)
+
+        def work(task):
+            self.background.post(task, self.start_output_stream, task, stream)
+            result = self.execute(code, task, on_output=stream.write, max_output_lines=0)
+            if result.timed_out:
+                stream.write("stderr", f"Execution Error: timed out after {get_pool().timeout} seconds\n")
+            return task, stream
+
+        self.run_in_background("Run Code", work, self.finish_output_stream)
+
+    def execute(self, code, task, on_output=None, max_output_lines=None):
+        # Both run in a warm sandbox worker, which is killed on timeout: programs the IR fully
+        # models as the optimized IR on the VM, the rest as source
+        analysis = self.analyze_buffer(code, task)
+        if not analysis.syntax_error:
+            with self.stage("optimize"):
+                program, _ = optimize(analysis.ir)
+            if supports(program):
+                self.background.status(task, f"{task.name}: executing on the VM")
+                with self.stage("execute (vm)"):
+                    return get_pool().run(program, cancel=task.cancel_event, on_output=on_output,
+                                          max_output_lines=max_output_lines)
+        self.background.status(task, f"{task.name}: executing")
+        with self.stage("execute (worker)"):
+            return get_pool().run(code, cancel=task.cancel_event, on_output=on_output,
+                                  max_output_lines=max_output_lines)
+
+    def run_tests(self):
+        code = self.text_area.get("1.0", "end-1c")
+        if not code.strip():
+            messagebox.showerror("Error", "No code to run.")
+            return
+        cases_path = filedialog.askopenfilename(title="Open Test Cases",
+                                                filetypes=[("JSON Test Cases", "*.json"), ("All Files", "*.*")])
+        if not cases_path:
+            return
         try:
-            # Run the code using subprocess and capture output
-            process = subprocess.run(["python", "-c", code], capture_output=True, text=True)
-            output = process.stdout if process.stdout else process.stderr
-            
-            # Display output in the output area
+            cases = load_cases(cases_path)
+        except (OSError, ValueError, AttributeError) as e:
+            messagebox.showerror("Error", f"Could not read test cases: {e}")
+            return
+
+        def work(task):
+            finished = iter(range(1, len(cases) + 1))  # next() is atomic, results arrive on pool threads
+
+            def on_result(index, result):
+                self.background.status(task, f"{task.name}: {next(finished)}/{len(cases)} cases")
+
+            with self.stage("grade"):
+                results = grade(code, cases, cancel=task.cancel_event, on_result=on_result)
+            task.check()
+            return self.format_tests(cases, results)
+
+        self.run_in_background("Run Tests", work)
+
+    @staticmethod
+    def format_tests(cases, results):
+        passed = sum(result.passed for result in results)
+        lines = []
+        for case, result in zip(cases, results):
+            lines.append(format_result(result))
+            if result.passed:
+                continue
+            if case.expected is not None and result.exit_code == 0 and not result.timed_out:
+                expected, got = normalize_output(case.expected).split("\n"), normalize_output(result.stdout).split("\n")
+                line = next((i for i, pair in enumerate(zip(expected, got)) if pair[0] != pair[1]),
+                            min(len(expected), len(got)))
+                lines.append(f"    line {line + 1}: expected {expected[line] if line < len(expected) else '<end>'!r}, "
+                             f"got {got[line] if line < len(got) else '<end>'!r}")
+            elif result.stderr.strip():
+                lines.append(f"    {result.stderr.strip().splitlines()[-1]}")
+        return Document([f"Tests: {passed}/{len(results)} passed"], lines)
+
+    def start_output_stream(self, task, stream):
+        self.output_view.release()  # Streamed output is appended to the widget directly
+        self.output_area.config(state=tk.NORMAL)
+        self.output_area.tag_config("stderr", foreground="red")
+        self.output_area.tag_config("truncated", foreground="gray")
+        self.output_area.config(state=tk.DISABLED)
+        self.truncated_lines = 0
+        self.drain_output_stream(task, stream)
+
+    def drain_output_stream(self, task, stream):
+        if task.cancelled:
+            return
+        lines, dropped = stream.take()
+        if lines or dropped:
             self.output_area.config(state=tk.NORMAL)
-            self.output_area.delete("1.0", tk.END)
-            self.output_area.insert(tk.END, output)
+            had_marker = self.truncated_lines > 0
+
+            # Insert whole runs of same-stream lines in one call
+            start = 0
+            for index in range(1, len(lines) + 1):
+                if index == len(lines) or lines[index][0] != lines[start][0]:
+                    text = "".join(line for _, line in lines[start:index])
+                    self.output_area.insert(tk.END, text, ("stderr",) if lines[start][0] == "stderr" else ())
+                    start = index
+
+            # Keep at most output_max_lines lines of output below the truncation marker
+            first_line = 2 if had_marker else 1
+            line_count = int(self.output_area.index("end-1c").split(".")[0]) - first_line
+            excess = max(line_count - self.output_max_lines, 0)
+            if excess:
+                self.output_area.delete(f"{first_line}.0", f"{first_line + excess}.0")
+            self.truncated_lines += dropped + excess
+            if self.truncated_lines:
+                if had_marker:
+                    self.output_area.delete("1.0", "2.0")
+                self.output_area.insert("1.0", truncation_marker(self.truncated_lines), ("truncated",))
+
             self.output_area.config(state=tk.DISABLED)
-        
-        except Exception as e:
-            messagebox.showerror("Execution Error", str(e))
+            self.output_area.see(tk.END)
+        if not stream.closed:
+            self.root.after(STREAM_INTERVAL_MS, self.drain_output_stream, task, stream)
+
+    def finish_output_stream(self, finished):
+        task, stream = finished
+        stream.close()
+        self.drain_output_stream(task, stream)
+
+    def show_status(self, text):
+        self.status_bar.config(text=text)
+
+    def run_in_background(self, name, work, on_done=None):
+        # Pipeline stages run off the Tk main thread; results are displayed back on it
+        def profiled(task):
+            self.profiler = Profiler(self.cprofile_stages)
+            try:
+                with self.profiler.stage(name, "run"):
+                    return work(task)
+            finally:
+                self.background.post(task, self.show_timings, self.profiler)
+                self.profiler = None
+
+        self.background.submit(name, profiled, on_done or self.display_output)
+
+    def stage(self, name):
+        # Times a stage of the run in progress
+        return self.profiler.stage(name) if self.profiler is not None else untimed(name)
+
+    def show_timings(self, profiler):
+        self.last_profiler = profiler
+        self.timing_panel.delete(*self.timing_panel.get_children())
+        for name, calls, wall, cpu, allocations in profiler.summary():
+            self.timing_panel.insert("", tk.END, values=(name, calls, f"{wall * 1000:.1f}", f"{cpu * 1000:.1f}", allocations))
+
+    def export_trace(self):
+        if self.last_profiler is None:
+            messagebox.showinfo("Export Trace", "Run a stage first.")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Chrome Trace", "*.json")])
+        if file_path:
+            try:
+                self.last_profiler.export(file_path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not export trace: {e}")
+
+    def toggle_cprofile(self, stage):
+        self.cprofile_stages ^= {stage}
+
+    def show_cprofile_stats(self):
+        if self.last_profiler is None or not self.last_profiler.profiles:
+            messagebox.showinfo("cProfile", "Enable cProfile for a stage in the Profiling menu and run it first.")
+            return
+        self.display_output("\n".join(self.last_profiler.profile_stats(name) for name in self.last_profiler.profiles))
     
-    def display_output(self, text):
-        self.output_area.config(state=tk.NORMAL)
-        self.output_area.delete(1.0, tk.END)
-
-        # Define color mappings for different IR instructions
-        color_tags = {
-            "STORE": "red",
-            "BINARY_OP": "yellow",
-            "LOAD_CONST": "blue",
-            "LOAD_VAR": "cyan",
-            "CALL": "green",
-            "IF_START": "magenta",
-            "RETURN": "gray"
-        }
-
-        # Configure tag colors in Tkinter text widget (MUST be done before inserting)
-        for tag, color in color_tags.items():
-            self.output_area.tag_config(tag, foreground=color)
-
-        # Apply color tags to the text
-        for line in text.split("\n"):
-            words = line.split()
-            if words:
-                instr = words[0]  # First word (IR instruction)
-                tag = color_tags.get(instr, None)  # Get corresponding color
-
-                if tag:
-                    self.output_area.insert(tk.END, line + "\n", tag)  # Insert with tag
-                    self.output_area.tag_add(tag, "end-2l linestart", "end-2l lineend")
-                else:
-                    self.output_area.insert(tk.END, line + "\n")  # Insert normally
+    def display_output(self, output):
+        # Only the lines in view are put in output_area; output is a str or an output_view.Document
+        self.output_view.show(output if isinstance(output, Document) else Document.from_text(output))
 
-        self.output_area.config(state=tk.DISABLED)
+    def analyze_buffer(self, code, task):
+        # Only the top-level statements edited since the last run are re-analyzed
+        if not self.engine.chunks:
+            with self.stage("cache lookup"):
+                self.engine = self.stage_cache.get(code) or self.engine
+
+        def progress(stage, done, total):
+            self.background.status(task, f"{task.name}: {stage} {done}/{total}")
+
+        result = self.engine.update(code, progress, self.profiler)
+        task.check()
+        return result
 
-        
     def run_lexer(self):
-        try:
-            code = self.text_area.get(1.0, tk.END)
-            tokens = self.lexer(code)
-            self.display_output(f"Tokens:\n{tokens}")
-        except Exception as e:
-            self.display_output(f"Lexical Analysis Error: {str(e)}")
+        code = self.text_area.get("1.0", tk.END).strip()
+
+        def work(task):
+            try:
+                result = self.analyze_buffer(code, task)
+                # Invalid tokens are listed after the valid ones rather than failing the whole run
+                skipped = [f"Invalid token(s) skipped: {', '.join(result.invalid_tokens)}"] if result.invalid_tokens else []
+                return Document(["Tokens:"], TokenLines(result.tokens), skipped)
+            except Exception as e:
+                return f"Lexical Analysis Error: {str(e)}"
+
+        self.run_in_background("Lexical Analysis", work)
     
     def run_parser(self):
-        try:
-            code = self.text_area.get(1.0, tk.END)
-            tree = self.parser(code)  
-            self.display_output("Syntax Analysis: Valid")
-        except Exception as e:
-            self.display_output(f"Syntax Analysis Error: {str(e)}")
+        code = self.text_area.get("1.0", tk.END).strip()
+
+        def work(task):
+            try:
+                result = self.analyze_buffer(code, task)
+                if result.syntax_error:
+                    raise result.syntax_error
+                return "Syntax Analysis: Valid"
+            except Exception as e:
+                return f"Syntax Analysis Error: {str(e)}"
+
+        self.run_in_background("Syntax Analysis", work)
     
+    def format_semantic(self, errors, warnings):
+        # Lines of the report; a large file can have many thousands of issues
+        issues = errors + warnings
+        if not issues:
+            return ["Semantic Analysis: No issues found"]
+        return [f"Semantic Analysis: {issues[0]}", *issues[1:]]
+
     def run_semantic(self):
-        try:
-            code = self.text_area.get("1.0", tk.END).strip()  # Get code from text area
-            tree = ast.parse(code)  # Convert code to AST
-            errors = semantic_analyzer(tree)  # Call function (no 'self')
+        code = self.text_area.get("1.0", tk.END).strip()  # Get code from text area
 
-            output = "Semantic Analysis: " + ("No issues found" if not errors else "\n".join(errors))
-            self.display_output(output)  # Show results
-        except Exception as e:
-            self.display_output(f"Semantic Analysis Error: {str(e)}")
+        def work(task):
+            try:
+                result = self.analyze_buffer(code, task)
+                if result.syntax_error:
+                    raise result.syntax_error
+                return Document(self.format_semantic(result.errors, result.warnings))  # Show results
+            except Exception as e:
+                return f"Semantic Analysis Error: {str(e)}"
+
+        self.run_in_background("Semantic Analysis", work)
 
     def run_ir(self):
-        try:
-            code = self.text_area.get(1.0, tk.END).strip()  # Get code
-            tree = ast.parse(code)  # Parse code to AST
-            ir_code = generate_ir(tree)  # Call generate_ir (no 'self')
+        code = self.text_area.get(1.0, tk.END).strip()  # Get code
+
+        def work(task):
+            try:
+                result = self.analyze_buffer(code, task)
+                if result.syntax_error:
+                    raise result.syntax_error
+                return Document(["Intermediate Code:"], IRLines(result.ir))  # Show output
+            except Exception as e:
+                return f"Intermediate Code Generation Error: {str(e)}"
+
+        self.run_in_background("Intermediate Code", work)
 
-            self.display_output(f"Intermediate Code:\n{ir_code}")  # Show output
-        except Exception as e:
-            self.display_output(f"Intermediate Code Generation Error: {str(e)}")
+    def run_optimizer(self):
+        code = self.text_area.get(1.0, tk.END).strip()  # Get code
+
+        def work(task):
+            try:
+                result = self.analyze_buffer(code, task)
+                if result.syntax_error:
+                    raise result.syntax_error
+                program = result.ir
+                optimized, stats = optimize(program)
+                return Document(["Optimized Intermediate Code:"], IRLines(optimized), ["", "Optimization Report:"],
+                                format_stats(stats, len(program), len(optimized)).split("\n"))
+            except Exception as e:
+                return f"Optimization Error: {str(e)}"
+
+        self.run_in_background("Optimize", work)
     
     def run_all(self):
-        try:
-            code = self.text_area.get(1.0, tk.END).strip()  # Get user code
-            tokens = self.lexer(code)  # Tokenize code
-            tree = self.parser(code)  # Parse to AST
-            syntax_output = "Syntax Analysis: Valid"
-
-            # Run Semantic Analysis
-            errors = semantic_analyzer(tree)
-            semantic_output = "Semantic Analysis: " + ("No issues found" if not errors else "\n".join(errors))
-
-            # Generate Intermediate Representation (IR)
-            ir_code = generate_ir(tree)
-
-            # Execute Code and Capture Output
-            execution_output = run_code(code)
-
-            # Display Final Output
-            final_output = (f"Tokens:\n{tokens}\n\n" +
-                            f"{syntax_output}\n\n" +
-                            f"{semantic_output}\n\n" + "\n"
-                            f"Intermediate Code:\n{ir_code}\n\n" + "\n"
-                            f"Execution Output:\n{execution_output}")
-            
-            self.display_output(final_output)
-
-        except Exception as e:
-            self.display_output(f"Error during compilation: {str(e)}")
-    
-    def lexer(self, code):
-        tokens = re.findall(r'[a-zA-Z_][a-zA-Z_0-9]*|[=+\-*/()]|\d+', code)
-        return tokens
+        code = self.text_area.get(1.0, tk.END).strip()  # Get user code
+
+        def work(task):
+            try:
+                result = self.analyze_buffer(code, task)  # Tokenize, parse and analyze changed statements
+                if result.syntax_error:
+                    raise result.syntax_error
+                syntax_output = "Syntax Analysis: Valid"
+                semantic_output = self.format_semantic(result.errors, result.warnings)
+                try:
+                    if code not in self.stage_cache:
+                        with self.stage("cache store"):
+                            self.stage_cache.put(code, self.engine)
+                except OSError:
+                    pass  # The cache is only an optimization
+
+                # Execute Code and Capture Output
+                task.check()
+                execution = self.execute(code, task, max_output_lines=DEFAULT_MAX_OUTPUT_LINES)
+                if execution.timed_out:
+                    execution_output = f"Execution Error: timed out after {get_pool().timeout} seconds"
+                else:
+                    execution_output = (execution.stdout or execution.stderr).strip()
+                task.check()
+
+                # Display Final Output
+                return Document(["Tokens:"], TokenLines(result.tokens),
+                                ["", syntax_output, ""],
+                                semantic_output,
+                                ["", "", "Intermediate Code:"], IRLines(result.ir),
+                                ["", "", "Execution Output:"], execution_output.split("\n"))
+
+            except Exception as e:
+                return f"Error during compilation: {str(e)}"
+
+        self.run_in_background("Run All", work)
     
-    def parser(self, tree):
-        return ast.parse(tree)
+    def parser(self, code):
+        return parser(code)
     
     def show_readme(self):
         messagebox.showinfo("README", "Python Mini Compiler\n\nThis tool provides basic file operations and text editing capabilities.")
\ No newline at end of file
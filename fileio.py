@@ -0,0 +1,178 @@
+import os
+import mmap
+import queue
+import shutil
+import secrets
+import threading
+from lexer import tokenize_bytes
+
+CHUNK_SIZE = 1 << 20  # Bytes read (and characters written) at a time
+SCAN_CHECK_INTERVAL = 10000  # Tokens between cancellation checks while scanning
+
+
+class MappedSource:
+    """A source file mapped into memory, so it can be read in pieces or lexed as bytes.
+
+    Use as a context manager; data is the mmap (or b"" for an empty file,
+    which cannot be mapped).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.size = os.fstat(self.file.fileno()).st_size
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        except BaseException:
+            self.file.close()
+            raise
+
+    def chunks(self, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+        """Yield (text, bytes read so far), each piece ending at a line break where possible.
+
+        Line endings are translated to "\\n" as in text mode.
+        """
+        data, size = self.data, self.size
+        start = 0
+        while start < size:
+            end = min(start + chunk_size, size)
+            if end < size:
+                newline = data.rfind(b"\n", start, end)
+                if newline >= start:
+                    end = newline + 1
+                else:  # A very long line: split it between characters, never inside \r\n
+                    while end > start + 1 and (data[end] & 0xC0) == 0x80:
+                        end -= 1
+                    if data[end - 1] == 0x0D:
+                        end -= 1
+            text = data[start:end].decode(encoding)
+            yield text.replace("\r\n", "\n").replace("\r", "\n"), end
+            start = end
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def scan_tokens(path, check=None):
+    """Lex a file straight from its mapping; return (token count, INVALID tokens).
+
+    check, if given, is called every SCAN_CHECK_INTERVAL tokens so a
+    background task can be cancelled.
+    """
+    count = 0
+    invalid = []
+    with MappedSource(path) as source:
+        for token in tokenize_bytes(source.data):
+            count += 1
+            if token.kind == "INVALID":
+                invalid.append(token)
+            if check is not None and count % SCAN_CHECK_INTERVAL == 0:
+                check()
+    return count, invalid
+
+
+def _create_temporary(path):
+    """Create a new file next to path; return (descriptor, its path).
+
+    It is created like open() creates files, so the umask (and any default
+    ACL of the folder) gives it the permissions a new path would get,
+    without reading the process-wide umask.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    while True:
+        temporary = os.path.join(directory, f".{name}.{secrets.token_hex(4)}.tmp")
+        try:
+            flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+            return os.open(temporary, flags, 0o666), temporary
+        except FileExistsError:
+            continue
+
+
+def write_atomic(path, text, encoding="utf-8"):
+    """Replace path with text: write a temporary file next to it, sync it, then rename it over path.
+
+    Readers see either the old or the new file, never a partly written one.
+    """
+    descriptor, temporary = _create_temporary(path)
+    try:
+        with os.fdopen(descriptor, "w", encoding=encoding) as file:
+            for start in range(0, len(text), CHUNK_SIZE):
+                file.write(text[start:start + CHUNK_SIZE])
+            file.flush()
+            os.fsync(file.fileno())
+        try:
+            shutil.copymode(path, temporary)
+        except FileNotFoundError:
+            pass  # A new file keeps the permissions it was created with
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.unlink(temporary)
+        except OSError:
+            pass
+        raise
+
+
+class WriteBehindSaver:
+    """Saves files on a writer thread with write_atomic(), so saving never blocks the caller.
+
+    save() queues the text and returns at once; a newer save of the same
+    path replaces one still waiting. Outcomes are collected as
+    (path, error or None) and read with completed(), from the thread that
+    owns the UI. flush() waits until everything queued is written.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending = {}  # path -> latest text not yet being written
+        self.thread = None
+        self.results = queue.Queue()
+
+    @property
+    def busy(self):
+        with self.condition:
+            return self.thread is not None
+
+    def save(self, path, text):
+        with self.condition:
+            self.pending[path] = text
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._write_pending, name="write-behind")
+                self.thread.start()
+
+    def _write_pending(self):
+        while True:
+            with self.condition:
+                if not self.pending:
+                    self.thread = None
+                    self.condition.notify_all()
+                    return
+                path = next(iter(self.pending))
+                text = self.pending.pop(path)
+            try:
+                write_atomic(path, text)
+            except (OSError, UnicodeError) as e:
+                self.results.put((path, e))
+            else:
+                self.results.put((path, None))
+
+    def completed(self):
+        """The (path, error or None) of every save finished since the last call."""
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def flush(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.thread is None, timeout)
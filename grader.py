@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import argparse
+import threading
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from execution import WorkerPool, OutputBuffer, compile_program, DEFAULT_TIMEOUT, DEFAULT_MEMORY_LIMIT, DEFAULT_MAX_OUTPUT_LINES
+
+DEFAULT_WORKERS = min(os.cpu_count() or 1, 8)
+
+# expected None only requires the program to exit with code 0
+TestCase = namedtuple("TestCase", ["name", "input", "expected"], defaults=("", None))
+CaseResult = namedtuple("CaseResult", ["name", "passed", "stdout", "stderr", "exit_code", "timed_out", "duration",
+                                       "peak_rss"])
+
+
+def normalize_output(text):
+    """Output as judged: trailing whitespace of each line and trailing blank lines do not count."""
+    return "\n".join(line.rstrip() for line in text.rstrip().splitlines())
+
+
+def _last_lines(text, max_lines):
+    buffer = OutputBuffer(max_lines)
+    buffer.write("output", text)
+    return buffer.text("output")
+
+
+def outcome(case, result, max_output_lines=None):
+    """The CaseResult of running case, given the ExecutionResult of the run.
+
+    The whole output is judged; only its last max_output_lines lines per
+    stream are kept in the CaseResult.
+    """
+    passed = (not result.timed_out and result.exit_code == 0
+              and (case.expected is None or normalize_output(result.stdout) == normalize_output(case.expected)))
+    return CaseResult(case.name, passed, _last_lines(result.stdout, max_output_lines),
+                      _last_lines(result.stderr, max_output_lines), result.exit_code, result.timed_out, result.duration,
+                      result.peak_rss)
+
+
+def load_cases(path):
+    """Read test cases from a JSON file or a folder.
+
+    The JSON is a list of {"name", "input", "expected"} objects (only
+    "input" is needed). A folder holds NAME.in files, each with an optional
+    NAME.out holding the expected output.
+    """
+    if os.path.isdir(path):
+        cases = []
+        for name in sorted(entry[:-3] for entry in os.listdir(path) if entry.endswith(".in")):
+            with open(os.path.join(path, name + ".in"), "r", encoding="utf-8") as file:
+                stdin = file.read()
+            expected = None
+            if os.path.exists(os.path.join(path, name + ".out")):
+                with open(os.path.join(path, name + ".out"), "r", encoding="utf-8") as file:
+                    expected = file.read()
+            cases.append(TestCase(name, stdin, expected))
+        return cases
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    return [TestCase(case.get("name", str(index + 1)), case.get("input", ""), case.get("expected"))
+            for index, case in enumerate(data)]
+
+
+def grade(code, cases, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, memory_limit=DEFAULT_MEMORY_LIMIT,
+          max_output_lines=DEFAULT_MAX_OUTPUT_LINES, cancel=None, on_result=None):
+    """Run code against every test case and return their CaseResults, in the order of cases.
+
+    The source is compiled once; the cases run concurrently, each in a
+    sandboxed worker process of a pool of the given size, with its own
+    timeout and the pool's address space limit. on_result(index, result) is
+    called as each case finishes, from a pool thread. Setting the
+    threading.Event cancel stops the running cases and skips the rest.
+    """
+    try:
+        program = compile_program(code)
+    except SyntaxError:
+        error = "".join(traceback.format_exception_only(*sys.exc_info()[:2]))
+        results = [CaseResult(case.name, False, "", error, 1, False, 0.0, None) for case in cases]
+        for index, result in enumerate(results):
+            if on_result:
+                on_result(index, result)
+        return results
+
+    cancel = cancel or threading.Event()
+    pool = WorkerPool(size=max(min(workers, len(cases)), 1), timeout=timeout, memory_limit=memory_limit)
+
+    def run_case(index):
+        case = cases[index]
+        if cancel.is_set():
+            result = CaseResult(case.name, False, "", "Execution cancelled", None, False, 0.0, None)
+        else:
+            result = outcome(case, pool.run(program, stdin=case.input, cancel=cancel), max_output_lines)
+        if on_result:
+            on_result(index, result)
+        return result
+
+    try:
+        with ThreadPoolExecutor(pool.size, thread_name_prefix="grader") as executor:
+            return list(executor.map(run_case, range(len(cases))))
+    finally:
+        pool.close()
+
+
+def format_result(result):
+    memory = f"{result.peak_rss / 1e6:.1f} MB" if result.peak_rss is not None else "-"
+    status = "PASS" if result.passed else "TIMEOUT" if result.timed_out else "FAIL"
+    return f"{status} {result.name} ({result.duration * 1000:.1f} ms, {memory}, exit code {result.exit_code})"
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Run a program against test cases in sandboxed workers and print JSON lines.")
+    arg_parser.add_argument("program", help="Python source file to test")
+    arg_parser.add_argument("cases", help="JSON file of test cases, or a folder of NAME.in / NAME.out files")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_WORKERS, help="cases run at a time")
+    arg_parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds per case")
+    arg_parser.add_argument("--memory-limit", type=int, default=DEFAULT_MEMORY_LIMIT // (1024 * 1024),
+                            help="address space per worker in MB (0 for none)")
+    arg_parser.add_argument("-o", "--output", help="write JSON lines here instead of stdout")
+    args = arg_parser.parse_args(argv)
+    if args.jobs < 1:
+        arg_parser.error("--jobs must be at least 1")
+
+    with open(args.program, "r", encoding="utf-8") as file:
+        code = file.read()
+    cases = load_cases(args.cases)
+    results = grade(code, cases, args.jobs, args.timeout, args.memory_limit * 1024 * 1024,
+                    on_result=lambda index, result: print(format_result(result), file=sys.stderr))
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for result in results:
+            out.write(json.dumps(result._asdict()) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    passed = sum(result.passed for result in results)
+    print(f"{passed}/{len(results)} case(s) passed", file=sys.stderr)
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
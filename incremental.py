@@ -0,0 +1,348 @@
+import re
+import hashlib
+from bisect import bisect_right
+from collections import namedtuple
+from lexer import tokenize, TOKEN_SPEC
+from parser_module import parser
+from semantic import SemanticPass
+from symbols import Symbol, undo_symbols, redo_symbols
+from ir_generator import IRPass, IRProgram
+from visitor import FusedVisitor
+from profiling import untimed
+
+# Lines starting with these words continue the previous top-level statement
+CONTINUATION_WORDS = {"else", "elif", "except", "finally"}
+
+# Only the lexemes that matter for finding statement boundaries: line starts,
+# strings and comments (whose contents are skipped), brackets and backslash
+# line continuations
+BOUNDARY_REGEX = re.compile(
+    r"(?P<START>^(?=[^\s#])(?:[A-Za-z_]\w*|@)?)"
+    rf"|(?P<STRING>{dict(TOKEN_SPEC)['STRING']})"
+    r"|#[^\n]*"
+    r"|(?P<OPEN>[(\[{])"
+    r"|(?P<CLOSE>[)\]}])"
+    r"|(?P<CONTINUED>\\\r?\n)",
+    re.MULTILINE,
+)
+
+PROGRESS_EVERY = 256  # Chunks between progress callbacks
+
+# Stage outputs for one top-level chunk; they only depend on the chunk's text. ir_code is
+# None until the chunk is first analyzed, as it is generated in the same walk
+ParsedChunk = namedtuple("ParsedChunk", ["tokens", "invalid_tokens", "tree", "syntax_error", "ir_code"])
+
+
+class _Chunk:
+    __slots__ = ("digest", "line_count", "parsed", "errors", "warnings", "undo_log", "state_hash")
+
+    def __init__(self, digest, line_count, parsed):
+        self.digest = digest
+        self.line_count = line_count
+        self.parsed = parsed
+        self.errors = []
+        self.warnings = []
+        self.undo_log = None  # Symbol changes made by this chunk, None until analyzed
+        self.state_hash = 0  # state_hash() of the symbols after this chunk, once analyzed
+
+
+def iter_boundaries(code, pos=0):
+    """Yield the offset of every top-level statement start (with its decorators) after pos.
+
+    pos must itself be 0 or the start of a top-level statement.
+    """
+    depth = 0
+    after_decorator = False
+    continued = -1  # Start of the line after the latest backslash continuation
+    for match in BOUNDARY_REGEX.finditer(code, pos):
+        kind = match.lastgroup
+        if kind == "OPEN":
+            depth += 1
+        elif kind == "CLOSE":
+            depth = max(depth - 1, 0)
+        elif kind == "CONTINUED":
+            continued = match.end()
+        elif kind == "START" and depth == 0 and match.start() != continued:
+            word = match.group()
+            if after_decorator:
+                # A decorated def/class starts at its first decorator
+                after_decorator = word == "@"
+                continue
+            if word in CONTINUATION_WORDS:
+                continue
+            after_decorator = word == "@"
+            if match.start() > pos:
+                yield match.start()
+
+
+def split_chunks(code):
+    """Split code into the source text of each top-level statement."""
+    starts = [0, *iter_boundaries(code), len(code)]
+    return [code[start:end] for start, end in zip(starts, starts[1:]) if start < end]
+
+
+def parse_chunk(text, stage=untimed):
+    """Lex and parse one chunk; its IR is generated when it is analyzed."""
+    tokens = []
+    invalid_tokens = []
+    with stage("lex"):
+        for token in tokenize(text):
+            (invalid_tokens if token.kind == "INVALID" else tokens).append(token)
+
+    try:
+        with stage("parse"):
+            tree = parser(text)
+    except SyntaxError as e:
+        return ParsedChunk([t.value for t in tokens], invalid_tokens, None, e, IRProgram())
+    return ParsedChunk([t.value for t in tokens], invalid_tokens, tree, None, None)
+
+
+def _entry_hash(key, value):
+    if value is None or value is False:  # Absent entries do not count
+        return 0
+    if isinstance(value, Symbol):
+        key = (key, value.kind, value.type, value.params)
+    return int.from_bytes(hashlib.blake2b(repr(key).encode("utf-8", "surrogatepass"), digest_size=8).digest(), "big")
+
+
+def state_hash(previous, undo_log, symbols, used):
+    """Hash of the module-level symbol state after a chunk, from the hash before it and its undo log.
+
+    Only what a later top-level statement can see counts: the module's names
+    with their kind, type and parameters, module-level global and nonlocal
+    declarations and which module names have been read. Every entry's hash
+    is XORed in, so two chunks leaving equal states give equal hashes.
+    """
+    module = symbols.module
+    before = {}  # Entry key -> value before the chunk
+    for container, key, old in undo_log:
+        if container is module.symbols:
+            before.setdefault(("name", key), old if isinstance(old, Symbol) else None)
+        elif container is module.globals:
+            before.setdefault(("global", key), False)
+        elif container is module.nonlocals:
+            before.setdefault(("nonlocal", key), False)
+        elif container is used and key[0] is module:
+            before.setdefault(("used", key[1]), False)
+    for (kind, name), value in before.items():
+        after = (module.symbols.get(name) if kind == "name" else name in module.globals if kind == "global"
+                 else name in module.nonlocals if kind == "nonlocal" else (module, name) in used)
+        previous ^= _entry_hash((kind, name), value) ^ _entry_hash((kind, name), after)
+    return previous
+
+
+def _common_prefix(a, b):
+    # Binary search with slice comparisons keeps the scan at C speed
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a, b, limit):
+    lo, hi = 0, limit
+    len_a, len_b = len(a), len(b)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len_a - mid:len_a - lo] == b[len_b - mid:len_b - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class IncrementalResult:
+    """Combined view over the per-chunk results of one IncrementalEngine.update call.
+
+    Whole-buffer values such as the token list and IR are only joined when asked for.
+    """
+
+    def __init__(self, chunks, analyzed, module_errors, module_warnings, reanalyzed):
+        self.chunks = chunks
+        self.analyzed = analyzed  # Leading chunks that went through semantic analysis
+        self.module_errors = module_errors  # Diagnostics that need the whole module, see SemanticPass.module_diagnostics
+        self.module_warnings = module_warnings
+        self.reanalyzed = reanalyzed  # Chunks walked by semantic analysis in this update
+
+    @property
+    def chunk_count(self):
+        return len(self.chunks)
+
+    @property
+    def tokens(self):
+        return [token for chunk in self.chunks for token in chunk.parsed.tokens]
+
+    def invalid_token_positions(self):
+        """Yield INVALID tokens with their lines relative to the whole buffer."""
+        line_offset = 0
+        for chunk in self.chunks:
+            for token in chunk.parsed.invalid_tokens:
+                yield token._replace(line=token.line + line_offset)
+            line_offset += chunk.line_count
+
+    @property
+    def invalid_tokens(self):
+        return [f"{t.value!r} at line {t.line}, column {t.column}" for t in self.invalid_token_positions()]
+
+    @property
+    def syntax_error(self):
+        if self.analyzed == len(self.chunks):
+            return None
+        line_offset = sum(chunk.line_count for chunk in self.chunks[:self.analyzed])
+        e = self.chunks[self.analyzed].parsed.syntax_error  # Cached, so report a copy with buffer line numbers
+        return SyntaxError(e.msg, (e.filename, (e.lineno or 1) + line_offset, e.offset, e.text))
+
+    @property
+    def errors(self):
+        return [error for chunk in self.chunks[:self.analyzed] for error in chunk.errors] + self.module_errors
+
+    @property
+    def warnings(self):
+        warnings = [warning for chunk in self.chunks[:self.analyzed] for warning in chunk.warnings]
+        return warnings + self.module_warnings
+
+    @property
+    def ir(self):
+        """The IR of the whole buffer as one IRProgram."""
+        program = IRProgram()
+        for chunk in self.chunks[:self.analyzed]:
+            program.extend(chunk.parsed.ir_code)
+        return program
+
+    @property
+    def ir_code(self):
+        # Serialize chunk by chunk; jump targets are offset to index the whole buffer's IR
+        lines = []
+        for chunk in self.chunks[:self.analyzed]:
+            lines.extend(chunk.parsed.ir_code.lines(base=len(lines)))
+        return "\n".join(lines)
+
+
+class IncrementalEngine:
+    """Re-runs the lexer, parser, semantic analysis and IR generation only on edited statements.
+
+    The buffer is kept as a list of top-level statement chunks. On update
+    only the text between the unchanged prefix and suffix of the buffer is
+    re-split, and chunks are matched by content hash so the tokens, AST and
+    IR of unchanged statements are reused. Semantic analysis carries one
+    symbol table from chunk to chunk: the changes made from the first edited
+    chunk onwards are rolled back and those chunks are analyzed again, until
+    one past the edit sees the same module-level symbols as before it; the
+    changes of the rest are then replayed instead of re-analyzed.
+    """
+
+    def __init__(self):
+        self.code = ""
+        self.starts = []  # Offset of each chunk in self.code
+        self.chunks = []
+        self.analyzed = 0  # Leading chunks whose symbol changes are applied
+        self.symbols = SemanticPass().state
+
+    def update(self, code, progress=None, profiler=None):
+        """Analyze code and return an IncrementalResult.
+
+        progress(stage, done, total) is called periodically while chunks are
+        parsed and analyzed. With a profiling.Profiler, the lex, parse, ir
+        and semantic work on each re-analyzed chunk is recorded.
+        """
+        stage = profiler.stage if profiler is not None else untimed
+        try:
+            return self._update(code, progress, stage)
+        except BaseException:
+            self.__init__()  # Symbols may be half rolled back; the next update starts from scratch
+            raise
+
+    def _update(self, code, progress, stage):
+        old_code, old_starts, old_chunks = self.code, self.starts, self.chunks
+        prefix = _common_prefix(old_code, code)
+        if prefix == len(old_code) == len(code) and old_chunks:
+            return self._result(0)
+        suffix = _common_suffix(old_code, code, min(len(old_code), len(code)) - prefix)
+        delta = len(code) - len(old_code)
+        old_edit_end = len(old_code) - suffix
+
+        # Re-split from the chunk holding the character before the edit until a
+        # boundary past the edit lines up with an old one
+        first = max(bisect_right(old_starts, prefix - 1) - 1, 0)
+        scan_from = old_starts[first] if old_chunks else 0
+        new_starts = [scan_from]
+        resync = len(old_chunks)
+        for start in iter_boundaries(code, scan_from):
+            old_start = start - delta
+            if old_start >= old_edit_end:
+                index = bisect_right(old_starts, old_start) - 1
+                if index >= 0 and old_starts[index] == old_start:
+                    resync = index
+                    break
+            new_starts.append(start)
+        new_starts.append(old_starts[resync] + delta if resync < len(old_chunks) else len(code))
+
+        reusable = {chunk.digest: chunk.parsed for chunk in old_chunks[first:resync]}
+        starts, middle = [], []
+        for index, (start, end) in enumerate(zip(new_starts, new_starts[1:])):
+            if progress and index % PROGRESS_EVERY == 0:
+                progress("Lexing and parsing", index, len(new_starts) - 1)
+            if start < end:
+                text = code[start:end]
+                digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+                starts.append(start)
+                middle.append(_Chunk(digest, text.count("\n"), reusable.get(digest) or parse_chunk(text, stage)))
+
+        # Roll the symbol table back to its state before the first edited chunk; the
+        # changes of the analyzed chunks past the edit are kept so they can be replayed
+        reanalyze_from = min(first, self.analyzed)
+        replay = []  # (state hash before the chunk, redo log) of each, last first
+        for index in range(self.analyzed - 1, reanalyze_from - 1, -1):
+            redo_log = [] if index >= resync else None
+            undo_symbols(old_chunks[index].undo_log, redo_log)
+            if redo_log is not None:
+                replay.append((old_chunks[index - 1].state_hash if index else 0, redo_log))
+        replay.reverse()
+
+        self.code = code
+        self.starts = old_starts[:first] + starts + [start + delta for start in old_starts[resync:]]
+        self.chunks = old_chunks[:first] + middle + old_chunks[resync:]
+        return self._analyze(reanalyze_from, progress, stage, first + len(middle), replay)
+
+    def _analyze(self, first, progress=None, stage=untimed, replay_from=0, replay=()):
+        """Analyze the chunks from first on; replay holds the old analysis of those from replay_from on."""
+        self.analyzed = first
+        symbols, used = self.symbols[0], self.symbols[1]
+        walked = 0
+        for index in range(first, len(self.chunks)):
+            if progress and (index - first) % PROGRESS_EVERY == 0:
+                progress("Semantic analysis", index - first, len(self.chunks) - first)
+            previous_hash = self.chunks[index - 1].state_hash if index else 0
+            if 0 <= index - replay_from < len(replay) and replay[index - replay_from][0] == previous_hash:
+                # Same symbols as this chunk saw before the edit: the old results still hold
+                for _, redo_log in replay[index - replay_from:]:
+                    redo_symbols(redo_log)
+                self.analyzed += len(replay) - (index - replay_from)
+                break
+            parsed = self.chunks[index].parsed
+            if parsed.tree is None:
+                break  # Semantic analysis needs every earlier chunk to parse
+            semantic = SemanticPass(self.symbols, undo_log=[])
+            with stage("semantic"):
+                if parsed.ir_code is None:  # First analysis: generate the IR in the same walk
+                    ir_pass = IRPass()
+                    FusedVisitor([semantic, ir_pass]).walk(parsed.tree)
+                    parsed = parsed._replace(ir_code=ir_pass.finish())
+                else:
+                    FusedVisitor([semantic]).walk(parsed.tree)
+            chunk = _Chunk(self.chunks[index].digest, self.chunks[index].line_count, parsed)
+            chunk.errors, chunk.warnings, chunk.undo_log = semantic.errors, semantic.warnings, semantic.undo_log
+            chunk.state_hash = state_hash(previous_hash, chunk.undo_log, symbols, used)
+            self.chunks[index] = chunk
+            self.analyzed += 1
+            walked += 1
+        return self._result(walked)
+
+    def _result(self, reanalyzed):
+        complete = self.analyzed == len(self.chunks)
+        errors, warnings = SemanticPass(self.symbols).module_diagnostics() if complete else ([], [])
+        return IncrementalResult(list(self.chunks), self.analyzed, errors, warnings, reanalyzed)
@@ -0,0 +1,286 @@
+import os
+import ast
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from lexer import tokenize
+from parser_module import parser
+from semantic import SemanticPass
+from symbols import Symbol, MODULE
+from visitor import AnalysisPass, run_passes
+
+WATCH_INTERVAL = 2.0  # Seconds between scans of the watched folder
+SKIPPED_FOLDERS = {"__pycache__", "node_modules", "venv"}  # Besides hidden folders such as .git
+
+
+def scan_folder(root):
+    """Yield (path relative to root, (mtime_ns, size)) of every .py file under root."""
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:  # Removed or unreadable since it was listed
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith(".") and entry.name not in SKIPPED_FOLDERS:
+                        stack.append(entry.path)
+                elif entry.name.endswith(".py") and entry.is_file():
+                    info = entry.stat()
+                    yield os.path.relpath(entry.path, root), (info.st_mtime_ns, info.st_size)
+            except OSError:
+                continue
+
+
+def module_name(path):
+    """The dotted module name of a .py file, from its path relative to the project root."""
+    parts = path[:-3].replace(os.sep, "/").split("/")
+    if parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
+class FileSummary:
+    """What pre-analysis found in one project file.
+
+    names are the module-level names and functions the module-level
+    functions with their (minimum, maximum) positional arguments, as the
+    semantic pass records them. imports are (alias, module, name, line), with
+    name None for `import module`; calls are (alias, attribute, positional
+    args, line) of calls through a module-level import, e.g. alias(...) or
+    alias.attribute(...), with None for arguments that cannot be counted.
+    """
+
+    __slots__ = ("path", "module", "fingerprint", "errors", "warnings", "names", "functions", "imports", "calls")
+
+    def __init__(self, path, module, fingerprint, errors=(), warnings=(), names=frozenset(), functions=None,
+                 imports=(), calls=()):
+        self.path = path
+        self.module = module
+        self.fingerprint = fingerprint
+        self.errors = list(errors)
+        self.warnings = list(warnings)
+        self.names = names
+        self.functions = functions or {}
+        self.imports = list(imports)
+        self.calls = list(calls)
+
+    @property
+    def open_namespace(self):
+        """Whether the module may define names no summary can list."""
+        return "*" in self.names or "__getattr__" in self.names
+
+
+class SummaryPass(AnalysisPass):
+    """Collects the imports of a module and the calls made through them.
+
+    Runs after a SemanticPass in the same walk and reads its symbol table,
+    so a name is only taken as an import while it is bound to one.
+    """
+
+    def __init__(self, semantic, package):
+        self.symbols = semantic.symbols
+        self.package = package.split(".") if package else []  # Relative imports start from here
+        self.imports = []
+        self.calls = []
+
+    def absolute(self, module, level):
+        if not level:
+            return module
+        base = self.package[:len(self.package) - (level - 1)]
+        return ".".join(base + ([module] if module else []))
+
+    def visit_Import(self, node):
+        if self.symbols.current.kind == MODULE:
+            for alias in node.names:
+                if alias.asname:
+                    self.imports.append((alias.asname, alias.name, None, node.lineno))
+                else:
+                    top = alias.name.split(".")[0]
+                    self.imports.append((top, top, None, node.lineno))
+
+    def visit_ImportFrom(self, node):
+        if self.symbols.current.kind == MODULE:
+            module = self.absolute(node.module, node.level)
+            for alias in node.names:
+                self.imports.append((alias.asname or alias.name, module, alias.name, node.lineno))
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Name):
+            alias, attribute = func.id, None
+        elif isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+            alias, attribute = func.value.id, func.attr
+        else:
+            return
+        scope, symbol = self.symbols.resolve(alias)
+        if symbol is not None and symbol.kind == "import" and scope.kind == MODULE:
+            plain = not node.keywords and not any(isinstance(arg, ast.Starred) for arg in node.args)
+            self.calls.append((alias, attribute, len(node.args) if plain else None, node.lineno))
+
+    def finish(self):
+        return self.imports, self.calls
+
+
+def analyze_file(root, path, fingerprint):
+    """Lex, parse and analyze one file; runs in a worker process."""
+    module = module_name(path)
+    try:
+        with open(os.path.join(root, path), "r", encoding="utf-8") as file:
+            code = file.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return FileSummary(path, module, fingerprint, [f"Could not read file: {e}"])
+    warnings = [f"Warning: Invalid token {token.value!r} at line {token.line}, column {token.column}."
+                for token in tokenize(code) if token.kind == "INVALID"]
+    try:
+        tree = parser(code)
+    except SyntaxError as e:
+        return FileSummary(path, module, fingerprint, [f"Syntax Error: {e}"], warnings)
+    semantic = SemanticPass()
+    # Relative imports are resolved from the package the module is in
+    package = module if os.path.basename(path) == "__init__.py" else module.rpartition(".")[0]
+    summary = SummaryPass(semantic, package)
+    (errors, semantic_warnings), (imports, calls) = run_passes(tree, [semantic, summary])
+    symbols = semantic.symbols.module.symbols
+    functions = {name: symbol.params for name, symbol in symbols.items() if symbol.params is not None}
+    return FileSummary(path, module, fingerprint, errors, warnings + semantic_warnings, frozenset(symbols),
+                       functions, imports, calls)
+
+
+class ProjectIndexer:
+    """Keeps FileSummary objects for every .py file under a folder up to date.
+
+    A watcher thread scans the folder every interval seconds and compares
+    (mtime, size) fingerprints; new and changed files are analyzed in a
+    process pool. Its findings are queued, and poll(), called from the Tk
+    thread, applies them, so files, fingerprints and summaries are only
+    touched there. stop() waits for the thread and the pool to finish, so
+    nothing is left running when the window closes.
+    """
+
+    def __init__(self, interval=WATCH_INTERVAL, workers=None):
+        self.interval = interval
+        self.workers = workers
+        self.root = None
+        self.files = {}  # path -> fingerprint from the latest scan
+        self.summaries = {}  # path -> FileSummary of that fingerprint (or an older one, until it is replaced)
+        self.modules = {}  # module name -> path
+        self.results = queue.Queue()
+        self.stop_event = None
+        self.thread = None
+        self.pool = None
+
+    def watch(self, root):
+        self.stop()
+        self.root = root
+        self.files, self.summaries, self.modules = {}, {}, {}
+        self.results = queue.Queue()  # Results of the previous folder's watcher are dropped with its queue
+        self.stop_event = threading.Event()
+        # Spawned workers do not inherit the Tk process's threads and open descriptors
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self.thread = threading.Thread(target=self._watch, args=(root, self.stop_event, self.results, self.pool),
+                                       name="project-indexer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.pool.shutdown(wait=True, cancel_futures=True)  # Only waits for the files being analyzed
+            self.stop_event = self.thread = self.pool = None
+
+    def _watch(self, root, stop_event, results, pool):
+        known = {}
+        pending = {}  # path -> future of its analysis
+        while not stop_event.is_set():
+            current = {}
+            for path, fingerprint in scan_folder(root):
+                if stop_event.is_set():
+                    return
+                current[path] = fingerprint
+            if current != known:
+                results.put(("files", current))
+            for path, fingerprint in current.items():
+                if known.get(path) != fingerprint:
+                    if path in pending:
+                        pending.pop(path).cancel()
+                    future = pool.submit(analyze_file, root, path, fingerprint)
+                    future.add_done_callback(lambda future: self._done(future, results))
+                    pending[path] = future
+            pending = {path: future for path, future in pending.items() if not future.done()}
+            known = current
+            stop_event.wait(self.interval)
+
+    @staticmethod
+    def _done(future, results):
+        if not future.cancelled() and future.exception() is None:
+            results.put(("summary", future.result()))
+
+    def poll(self):
+        """Apply the watcher's findings; return True if the set of files changed."""
+        changed = False
+        while True:
+            try:
+                kind, value = self.results.get_nowait()
+            except queue.Empty:
+                return changed
+            if kind == "files":
+                changed = changed or value.keys() != self.files.keys()
+                self.files = value
+                for path in self.summaries.keys() - value.keys():
+                    del self.summaries[path]
+                self.modules = {module_name(path): path for path in value}
+            elif value.path in self.files:
+                self.summaries[value.path] = value
+
+    def is_current(self, path):
+        summary = self.summaries.get(path)
+        return summary is not None and summary.fingerprint == self.files.get(path)
+
+    def cross_file_errors(self, summary):
+        """Errors in imports of project modules and in calls through them."""
+        errors = []
+        origins = {}  # alias -> module name and imported name it stands for
+        for alias, module, name, line in summary.imports:
+            origins[alias] = (module, name)
+            target = self.module_summary(module)
+            if target is None or name is None or name == "*":
+                continue
+            if name not in target.names and not target.open_namespace and f"{module}.{name}" not in self.modules:
+                errors.append(f"Error: Module '{module}' has no name '{name}' (line {line}).")
+        for alias, attribute, given, line in summary.calls:
+            module, name = origins.get(alias, (None, None))
+            if module is None:
+                continue
+            if attribute is None:  # from module import name; name(...)
+                function = name
+            elif name is None:  # import module; module.function(...)
+                function = attribute
+            else:  # from package import module; module.function(...)
+                module, function = f"{module}.{name}", attribute
+            target = self.module_summary(module)
+            if target is None or function is None:
+                continue
+            called = f"{alias}.{attribute}" if attribute else alias
+            if function not in target.names:
+                if not target.open_namespace and f"{module}.{function}" not in self.modules:
+                    errors.append(f"Error: Undefined function '{called}' called (line {line}).")
+            elif function in target.functions:
+                errors.extend(f"{error[:-1]} (line {line})." for error in
+                              SemanticPass.call_errors(Symbol(called, "function", params=target.functions[function]),
+                                                       given))
+        return errors
+
+    def module_summary(self, module):
+        path = self.modules.get(module)
+        return self.summaries.get(path) if path is not None else None
+
+    def diagnostics(self, path):
+        """(errors, warnings) of a file, including cross-file checks, or None if it has not been analyzed."""
+        summary = self.summaries.get(path)
+        if summary is None:
+            return None
+        return summary.errors + self.cross_file_errors(summary), summary.warnings
@@ -1,24 +1,414 @@
 import ast
+from array import array
+from symbols import SymbolTable, FUNCTION as FUNCTION_SCOPE
+from visitor import AnalysisPass, run_passes
+
+# Opcodes, stored one byte per instruction
+OPCODES = ["STORE", "LOAD_CONST", "LOAD_VAR", "BINARY_OP", "CALL", "IF_START", "JUMP", "RETURN",
+           "FUNCTION", "POP", "DUP", "UNARY_OP", "COMPARE", "GET_ITER", "FOR_ITER", "EVAL", "BEGIN", "END",
+           "STORE_GLOBAL", "LOAD_GLOBAL", "LOAD_FREE"]
+(STORE, LOAD_CONST, LOAD_VAR, BINARY_OP, CALL, IF_START, JUMP, RETURN,
+ FUNCTION, POP, DUP, UNARY_OP, COMPARE, GET_ITER, FOR_ITER, EVAL, BEGIN, END,
+ STORE_GLOBAL, LOAD_GLOBAL, LOAD_FREE) = range(len(OPCODES))
+
+# How each opcode's operand is interpreted
+NAME_OPERANDS = {STORE, LOAD_VAR, BINARY_OP, CALL, FUNCTION, UNARY_OP, COMPARE, EVAL, BEGIN, END,
+                 STORE_GLOBAL, LOAD_GLOBAL, LOAD_FREE}  # Index into IRProgram.names
+JUMP_OPERANDS = {IF_START, JUMP, FOR_ITER}  # Instruction index
+
+# Code the IR does not model is still walked, so its loads and stores appear,
+# but it is marked: EVAL <NodeType> after an expression or at the start of a
+# simple statement, BEGIN/END <NodeType> around compound statements and
+# expressions that bind names of their own.
+MODELED_STATEMENTS = {ast.Assign, ast.AugAssign, ast.Expr, ast.If, ast.While, ast.For, ast.Break, ast.Continue,
+                      ast.Return, ast.FunctionDef, ast.Pass, ast.Global}
+MODELED_EXPRESSIONS = {ast.Constant, ast.Name, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call}
+SCOPED_EXPRESSIONS = {ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp}
+
+
+class Instruction:
+    """A decoded instruction, produced when iterating over an IRProgram."""
+
+    __slots__ = ("opcode", "operand", "argcount")
+
+    def __init__(self, opcode, operand=None, argcount=0):
+        self.opcode = opcode
+        self.operand = operand  # Decoded value: name, constant or jump target
+        self.argcount = argcount  # Positional arguments of a CALL or parameters of a FUNCTION
+
+    @property
+    def name(self):
+        return OPCODES[self.opcode]
+
+    def __eq__(self, other):
+        return (isinstance(other, Instruction)
+                and (self.opcode, self.operand, self.argcount) == (other.opcode, other.operand, other.argcount))
+
+    def __repr__(self):
+        return f"Instruction({self.name}, {self.operand!r}, {self.argcount})"
+
+    def __str__(self):
+        if self.opcode == LOAD_CONST:
+            return f"LOAD_CONST {self.operand!r}"
+        if self.operand is None:
+            return self.name
+        return f"{self.name} {self.operand}"
+
+
+class IRProgram:
+    """Array-backed instruction table with interned constant and name pools.
+
+    Each instruction is an opcode byte, an operand (pool index or jump
+    target) and an argument count, stored in parallel arrays. Text is only
+    produced by to_text() when the IR is displayed.
+    """
+
+    __slots__ = ("opcodes", "operands", "argcounts", "constants", "names", "_constant_index", "_name_index")
+
+    def __init__(self):
+        self.opcodes = array("B")
+        self.operands = array("l")
+        self.argcounts = array("H")
+        self.constants = []
+        self.names = []
+        self._constant_index = {}
+        self._name_index = {}
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __bool__(self):
+        return len(self.opcodes) > 0
+
+    def __iter__(self):
+        return (self.instruction(index) for index in range(len(self.opcodes)))
+
+    def __str__(self):
+        return self.to_text()
+
+    def __getstate__(self):
+        return (self.opcodes, self.operands, self.argcounts, self.constants, self.names)
+
+    def __setstate__(self, state):
+        self.opcodes, self.operands, self.argcounts, self.constants, self.names = state
+        self._constant_index = {(type(value), value): index for index, value in enumerate(self.constants)}
+        self._name_index = {name: index for index, name in enumerate(self.names)}
+
+    def constant(self, value):
+        key = (type(value), value)  # Keep 1, 1.0 and True apart
+        index = self._constant_index.get(key)
+        if index is None:
+            index = self._constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def name(self, name):
+        index = self._name_index.get(name)
+        if index is None:
+            index = self._name_index[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def emit(self, opcode, operand=0, argcount=0):
+        """Append an instruction with an already-encoded operand and return its index."""
+        self.opcodes.append(opcode)
+        self.operands.append(operand)
+        self.argcounts.append(argcount)
+        return len(self.opcodes) - 1
+
+    def append(self, instruction):
+        """Encode and append a decoded Instruction; returns its index."""
+        opcode, operand = instruction.opcode, instruction.operand
+        if opcode == LOAD_CONST:
+            operand = self.constant(operand)
+        elif opcode in NAME_OPERANDS:
+            operand = self.name(operand)
+        elif operand is None:
+            operand = 0
+        return self.emit(opcode, operand, instruction.argcount)
+
+    def patch(self, index, target):
+        """Point the jump at index to the instruction index target."""
+        self.operands[index] = target
+
+    def instruction(self, index, base=0):
+        opcode = self.opcodes[index]
+        operand = self.operands[index]
+        if opcode == LOAD_CONST:
+            operand = self.constants[operand]
+        elif opcode in NAME_OPERANDS:
+            operand = self.names[operand]
+        elif opcode in JUMP_OPERANDS:
+            operand += base
+        else:
+            operand = None
+        return Instruction(opcode, operand, self.argcounts[index])
+
+    def lines(self, base=0):
+        """Text of each instruction; jump targets are offset by base."""
+        return [str(self.instruction(index, base)) for index in range(len(self.opcodes))]
+
+    def to_text(self, base=0):
+        return "\n".join(self.lines(base))
+
+    def extend(self, other):
+        """Append the instructions of other, re-interning its pools and relocating its jumps."""
+        base = len(self.opcodes)
+        constants = [self.constant(value) for value in other.constants]
+        names = [self.name(name) for name in other.names]
+        for opcode, operand, argcount in zip(other.opcodes, other.operands, other.argcounts):
+            if opcode == LOAD_CONST:
+                operand = constants[operand]
+            elif opcode in NAME_OPERANDS:
+                operand = names[operand]
+            elif opcode in JUMP_OPERANDS:
+                operand += base
+            self.emit(opcode, operand, argcount)
+
+
+class IRPass(AnalysisPass):
+    """Emits IR in evaluation order: operands before the instruction that consumes them.
+
+    Function bodies are tracked in a SymbolTable. Loads in a function are
+    emitted as LOAD_VAR and, once the whole function has been seen, turned
+    into LOAD_GLOBAL or LOAD_FREE if the name is not one of its locals.
+    Names declared global are stored with STORE_GLOBAL. Module-level code
+    only uses LOAD_VAR and STORE, so the IR of a top-level statement does not
+    depend on the rest of the module.
+    """
+
+    def __init__(self):
+        self.program = IRProgram()
+        self.callees = set()  # ids of Name nodes that are called directly, so not loaded
+        self.jumps = {}  # id(node) -> index of the jump to patch next
+        self.loops = []  # (continue target, break jumps, is a for loop) of the enclosing loops
+        self.breaks = {}  # id(loop node) -> break jumps to patch at its end
+        self.outer_loops = []  # Saved self.loops of the functions being defined
+        self.symbols = SymbolTable()
+        self.function_loads = []  # Per function being defined: (index, scope, name) of loads to classify
+
+    def emit_name(self, opcode, name, argcount=0):
+        return self.program.emit(opcode, self.program.name(name), argcount)
+
+    def load(self, name):
+        index = self.emit_name(LOAD_VAR, name)
+        if self.function_loads:
+            self.function_loads[-1].append((index, self.symbols.current, name))
+
+    def store(self, target):
+        if isinstance(target, ast.Name):
+            scope = self.symbols.define(target.id, "variable")[0]
+            global_store = scope is self.symbols.module and self.symbols.current is not scope
+            self.emit_name(STORE_GLOBAL if global_store else STORE, target.id)
+        else:
+            self.emit_name(EVAL, type(target).__name__)
+
+    # Fallbacks for code the IR does not model
+    def visit_stmt(self, node):
+        if type(node) not in MODELED_STATEMENTS:
+            if hasattr(node, "body"):
+                self.emit_name(BEGIN, type(node).__name__)
+            else:
+                self.emit_name(EVAL, type(node).__name__)
+
+    def leave_stmt(self, node):
+        if type(node) not in MODELED_STATEMENTS and hasattr(node, "body"):
+            self.emit_name(END, type(node).__name__)
+
+    def visit_expr(self, node):
+        if type(node) in SCOPED_EXPRESSIONS:
+            self.emit_name(BEGIN, type(node).__name__)
+
+    def leave_expr(self, node):
+        if type(node) in SCOPED_EXPRESSIONS:
+            self.emit_name(END, type(node).__name__)
+        elif type(node) not in MODELED_EXPRESSIONS and isinstance(getattr(node, "ctx", ast.Load()), ast.Load):
+            self.emit_name(EVAL, type(node).__name__)
+
+    def visit_excepthandler(self, node):
+        self.emit_name(BEGIN, type(node).__name__)
+
+    def leave_excepthandler(self, node):
+        self.emit_name(END, type(node).__name__)
+
+    def visit_match_case(self, node):
+        self.emit_name(BEGIN, "match_case")
+
+    def leave_match_case(self, node):
+        self.emit_name(END, "match_case")
+
+    def after_Try_orelse(self, node):
+        if node.finalbody:  # Also reached from anywhere in the try body
+            self.emit_name(EVAL, "finally")
+
+    after_TryStar_orelse = after_Try_orelse
+
+    # Statements
+    def leave_Assign(self, node):
+        for index, target in enumerate(node.targets):
+            if index < len(node.targets) - 1:  # a = b = value stores one value twice
+                self.program.emit(DUP)
+            self.store(target)
+
+    def after_AugAssign_target(self, node):
+        if isinstance(node.target, ast.Name):
+            self.load(node.target.id)
+
+    def leave_AugAssign(self, node):
+        self.emit_name(BINARY_OP, type(node.op).__name__)
+        self.store(node.target)
+
+    def leave_Expr(self, node):
+        self.program.emit(POP)  # Discard the value of an expression statement
+
+    # if: <test> IF_START else; <body> [JUMP end; else: <orelse>] end:
+    def after_If_test(self, node):
+        self.jumps[id(node)] = self.program.emit(IF_START)
+
+    def after_If_body(self, node):
+        if_start = self.jumps.pop(id(node))
+        if node.orelse:
+            self.jumps[id(node)] = self.program.emit(JUMP)
+        self.program.patch(if_start, len(self.program))
+
+    def leave_If(self, node):
+        if node.orelse:
+            self.program.patch(self.jumps.pop(id(node)), len(self.program))
+
+    # while: loop: <test> IF_START else; <body> JUMP loop; else: <orelse> end:
+    def visit_While(self, node):
+        self.loops.append((len(self.program), [], False))
+
+    def after_While_test(self, node):
+        self.jumps[id(node)] = self.program.emit(IF_START)
+
+    def after_While_body(self, node):
+        start, self.breaks[id(node)], _ = self.loops.pop()
+        self.program.emit(JUMP, start)
+        self.program.patch(self.jumps.pop(id(node)), len(self.program))
+
+    def leave_While(self, node):
+        for index in self.breaks.pop(id(node)):
+            self.program.patch(index, len(self.program))
+
+    # for: <iter> GET_ITER; loop: FOR_ITER else; STORE target; <body> JUMP loop; else: <orelse> end:
+    def after_For_iter(self, node):
+        self.program.emit(GET_ITER)
+        self.jumps[id(node)] = start = self.program.emit(FOR_ITER)
+        self.loops.append((start, [], True))
+        self.store(node.target)
+
+    def after_For_body(self, node):
+        start, self.breaks[id(node)], _ = self.loops.pop()
+        self.program.emit(JUMP, start)
+        self.program.patch(self.jumps.pop(id(node)), len(self.program))
+
+    def leave_For(self, node):
+        for index in self.breaks.pop(id(node)):
+            self.program.patch(index, len(self.program))
+
+    def visit_Break(self, node):
+        if self.loops:
+            _, breaks, is_for = self.loops[-1]
+            if is_for:
+                self.program.emit(POP)  # Drop the iterator
+            breaks.append(self.program.emit(JUMP))
+
+    def visit_Continue(self, node):
+        if self.loops:
+            self.program.emit(JUMP, self.loops[-1][0])
+
+    # def: FUNCTION name; JUMP end; STORE <parameters, last first>; <body> LOAD_CONST None; RETURN; end:
+    def after_FunctionDef_args(self, node):
+        args = node.args
+        if args.posonlyargs or args.vararg or args.kwonlyargs or args.kwarg or args.defaults:
+            self.emit_name(EVAL, "arguments")  # Only plain positional parameters are modeled
+        self.emit_name(FUNCTION, node.name, len(args.args))
+        self.symbols.define(node.name, "function")
+        self.jumps[id(node)] = self.program.emit(JUMP)
+        self.symbols.enter(FUNCTION_SCOPE, node.name)
+        self.function_loads.append([])
+        for arg in reversed(args.args):  # Arguments are pushed first to last
+            self.symbols.define(arg.arg, "parameter")
+            self.emit_name(STORE, arg.arg)
+        self.outer_loops.append(self.loops)  # break/continue cannot reach loops outside the function
+        self.loops = []
+
+    def after_FunctionDef_body(self, node):
+        self.classify_loads(self.function_loads.pop())
+        self.symbols.leave()
+        self.loops = self.outer_loops.pop()
+        self.program.emit(LOAD_CONST, self.program.constant(None))
+        self.program.emit(RETURN)
+        self.program.patch(self.jumps.pop(id(node)), len(self.program))
+
+    def classify_loads(self, loads):
+        for index, scope, name in loads:
+            owner = self.symbols.resolve(name, scope)[0]
+            if owner is scope:
+                continue  # A local, stays LOAD_VAR
+            if owner is not None and owner.kind == FUNCTION_SCOPE:
+                self.program.opcodes[index] = LOAD_FREE
+            else:
+                self.program.opcodes[index] = LOAD_GLOBAL
+                if self.function_loads:  # The enclosing function may still bind it further down
+                    self.function_loads[-1].append((index, scope, name))
+
+    def visit_Global(self, node):
+        self.symbols.declare(node.names)
+
+    def after_FunctionDef_decorator_list(self, node):
+        if node.decorator_list:
+            self.emit_name(EVAL, "decorator")
+
+    def after_FunctionDef_returns(self, node):
+        if node.returns is not None:
+            self.program.emit(POP)  # Annotations are evaluated but unused
+
+    def after_arg_annotation(self, node):
+        if node.annotation is not None:
+            self.program.emit(POP)
+
+    def leave_Return(self, node):
+        if node.value is None:
+            self.program.emit(LOAD_CONST, self.program.constant(None))
+        self.program.emit(RETURN)
+
+    # Expressions
+    def leave_BinOp(self, node):
+        self.emit_name(BINARY_OP, type(node.op).__name__)
+
+    def leave_UnaryOp(self, node):
+        self.emit_name(UNARY_OP, type(node.op).__name__)
+
+    def leave_Compare(self, node):
+        if len(node.ops) == 1:
+            self.emit_name(COMPARE, type(node.ops[0]).__name__)
+        else:  # Chained comparisons short-circuit
+            self.emit_name(EVAL, "Compare")
+
+    def visit_Constant(self, node):
+        self.program.emit(LOAD_CONST, self.program.constant(node.value))
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and id(node) not in self.callees:
+            self.load(node.id)
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Name):
+            self.callees.add(id(node.func))
+
+    def leave_Call(self, node):
+        func_name = node.func.id if isinstance(node.func, ast.Name) else ast.unparse(node.func)
+        self.callees.discard(id(node.func))
+        if node.keywords or any(isinstance(arg, ast.Starred) for arg in node.args):
+            self.emit_name(EVAL, "Call")
+        else:
+            self.emit_name(CALL, func_name, len(node.args))
+
+    def finish(self):
+        return self.program
+
 
 def generate_ir(tree):
-    ir_code = []
-    
-    for node in ast.walk(tree):
-        if isinstance(node, ast.Assign):
-            if isinstance(node.targets[0], ast.Name):
-                ir_code.append(f"STORE {node.targets[0].id}")
-        elif isinstance(node, ast.BinOp):
-            op_type = type(node.op).__name__
-            ir_code.append(f"BINARY_OP {op_type}")
-        elif isinstance(node, ast.Constant):
-            ir_code.append(f"LOAD_CONST {node.value}")
-        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
-            ir_code.append(f"LOAD_VAR {node.id}")
-        elif isinstance(node, ast.Call):
-            ir_code.append(f"CALL {node.func.id}")
-        elif isinstance(node, ast.If):
-            ir_code.append("IF_START")
-        elif isinstance(node, ast.Return):
-            ir_code.append("RETURN")
-    
-    return "\n".join(ir_code)
+    return run_passes(tree, [IRPass()])[0]
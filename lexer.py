@@ -1,17 +1,90 @@
 import re
+from collections import namedtuple
 
-def lexer(self, code):
-    # Define valid token patterns
-    token_pattern = r'[a-zA-Z_][a-zA-Z_0-9]*|[=+\-*/()]|\d+|".*?"|\'.*?\''
-    valid_tokens = re.findall(token_pattern, code)
+# A single lexeme with its kind and 1-based line / 0-based column position
+Token = namedtuple("Token", ["kind", "value", "line", "column"])
+
+# Define valid token patterns (one master pattern, tried in order)
+TOKEN_SPEC = [
+    ("COMMENT", r'#[^\n]*'),
+    ("STRING", r'"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:[^"\\\n]|\\(?:\r\n|[\s\S]))*"|\'(?:[^\'\\\n]|\\(?:\r\n|[\s\S]))*\''),
+    ("NUMBER", r'\d+(?:\.\d+)?'),
+    ("NAME", r'[a-zA-Z_][a-zA-Z_0-9]*'),
+    ("OP", r'\*\*|//|==|!=|<=|>=|->|[=+\-*/%<>()\[\]{}:;,.&|^~@]'),
+    ("NEWLINE", r'\n'),
+    ("SKIP", r'[ \t\r\f\\]+'),
+    ("INVALID", r'.'),
+]
+
+TOKEN_REGEX = re.compile("|".join(f"(?P<{kind}>{pattern})" for kind, pattern in TOKEN_SPEC))
+
+# The same pattern over UTF-8 bytes; an invalid character is one whole multi-byte sequence
+BYTES_TOKEN_REGEX = re.compile("|".join(f"(?P<{kind}>{pattern})" for kind, pattern in TOKEN_SPEC[:-1]).encode()
+                               + rb"|(?P<INVALID>[\xc0-\xff][\x80-\xbf]*|.)")
+
+# Kinds that are scanned but never handed to later stages
+IGNORED_KINDS = {"COMMENT", "NEWLINE", "SKIP"}
 
-    # Find all individual words/characters (including invalid ones)
-    all_tokens = re.findall(r'\S+|\n', code)  # Matches all non-whitespace sequences and newlines
 
-    # Detect invalid tokens (anything not matching the valid pattern)
-    invalid_tokens = [token for token in all_tokens if not re.fullmatch(token_pattern, token) and token.strip()]
+def tokenize(code):
+    """Yield Token objects for code in a single pass, including INVALID ones."""
+    line = 1
+    line_start = 0
+    for match in TOKEN_REGEX.finditer(code):
+        kind = match.lastgroup
+        if kind == "NEWLINE":
+            line += 1
+            line_start = match.end()
+            continue
+        if kind in IGNORED_KINDS:
+            continue
+        value = match.group()
+        yield Token(kind, value, line, match.start() - line_start)
+        if kind == "STRING" and "\n" in value:  # Triple-quoted (or backslash-continued) strings may span lines
+            line += value.count("\n")
+            line_start = match.start() + value.rindex("\n") + 1
 
-    if invalid_tokens:
-        raise ValueError(f"Lexical Analysis Error: Invalid token(s) detected: {', '.join(invalid_tokens)}")
 
-    return valid_tokens
\ No newline at end of file
+def tokenize_bytes(data):
+    """tokenize() for UTF-8 bytes, e.g. a memory-mapped file, without decoding it first.
+
+    Token values are decoded and columns count characters, as in tokenize().
+    """
+    line = 1
+    line_start = 0
+    ascii_line = None  # Whether the current line is ASCII, so byte and character columns agree
+    counted = 0  # On other lines, the column at byte offset counted_to is known
+    counted_to = 0
+    for match in BYTES_TOKEN_REGEX.finditer(data):
+        kind = match.lastgroup
+        if kind == "NEWLINE":
+            line += 1
+            line_start = match.end()
+            ascii_line = None
+            continue
+        if kind in IGNORED_KINDS:
+            continue
+        start = match.start()
+        if ascii_line is None:
+            line_end = data.find(b"\n", line_start)
+            ascii_line = data[line_start:line_end if line_end >= 0 else len(data)].isascii()
+            counted, counted_to = 0, line_start
+        if ascii_line:
+            column = start - line_start
+        else:
+            # Count on from the previous token, so a long non-ASCII line is decoded once in all
+            counted += len(data[counted_to:start].decode("utf-8", "replace"))
+            counted_to = start
+            column = counted
+        value = match.group().decode("utf-8", "replace")
+        yield Token(kind, value, line, column)
+        if kind == "STRING" and "\n" in value:  # Triple-quoted (or backslash-continued) strings may span lines
+            line += value.count("\n")
+            line_start = start + match.group().rindex(b"\n") + 1
+            ascii_line = None
+
+
+def lexer(self, code):
+    # Characters no pattern accepts (e.g. non-ASCII identifiers) are skipped, not fatal;
+    # tokenize() still reports them as INVALID tokens for callers that want to warn
+    return [token.value for token in tokenize(code) if token.kind != "INVALID"]
@@ -0,0 +1,86 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from lexer import tokenize
+from parser_module import parser
+from semantic import SemanticPass
+from visitor import run_passes
+
+LIVE_DELAY_MS = 400  # Quiet time after the last edit before the buffer is analyzed
+CHECK_INTERVAL = 0.05  # Seconds between cancellation checks while waiting for the checker process
+
+
+def _columns(code):
+    """A function turning (line, UTF-8 byte offset) from the ast into a character column, as Tk counts them."""
+    lines = None
+
+    def column(line, offset):
+        nonlocal lines
+        if lines is None:
+            lines = code.split("\n")
+        text = lines[line - 1] if 0 < line <= len(lines) else ""
+        return offset if text.isascii() else len(text.encode("utf-8")[:offset].decode("utf-8", "ignore"))
+
+    return column
+
+
+def diagnose(code, check=None):
+    """Lex, parse and analyze code; return (line, column, end line, end column, message) of each error.
+
+    Columns count characters. check, if given, is called between the
+    stages so a newer snapshot can cancel the run.
+    """
+    check = check or (lambda: None)
+    diagnostics = [(token.line, token.column, token.line, token.column + len(token.value),
+                    f"Invalid token: {token.value!r}") for token in tokenize(code) if token.kind == "INVALID"]
+    check()
+    try:
+        tree = parser(code)
+    except SyntaxError as e:
+        line, column = e.lineno or 1, max((e.offset or 1) - 1, 0)
+        end_line, end_column = e.end_lineno or line, max((e.end_offset or 0) - 1, column)
+        diagnostics.append((line, column, end_line, end_column, f"Syntax Error: {e.msg}"))
+        return diagnostics
+    check()
+    semantic = SemanticPass()
+    semantic.locations = []
+    errors = run_passes(tree, [semantic])[0][0]
+    column = _columns(code)
+    for message, (line, offset, end_line, end_offset) in zip(errors, semantic.locations):
+        diagnostics.append((line, column(line, offset), end_line, column(end_line, end_offset), message))
+    return diagnostics
+
+
+class LiveChecker:
+    """Runs diagnose() in a process of its own.
+
+    Analyzing a large buffer on a thread holds the GIL and stalls Tk for
+    hundreds of milliseconds; in a separate process it never does. The
+    process is spawned on first use and runs one snapshot at a time.
+    """
+
+    def __init__(self):
+        self.pool = None
+
+    def diagnose(self, code, check=None):
+        """diagnose(code) in the checker process; check() is called while waiting and may raise to give up."""
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"))
+        future = self.pool.submit(diagnose, code)
+        try:
+            while True:
+                try:
+                    return future.result(timeout=CHECK_INTERVAL)
+                except FutureTimeoutError:
+                    if check is not None:
+                        check()
+        except BrokenProcessPool:
+            self.pool = None  # e.g. the process ran out of memory; start a new one next time
+            raise
+        finally:
+            future.cancel()  # No effect once it has started; a newer snapshot then waits for it
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
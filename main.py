@@ -1,7 +1,14 @@
-import tkinter as tk
-from ui import PythonCompiler
+import sys
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Headless batch mode, e.g. `python main.py submissions/ --stages semantic`
+        from cli import main
+        sys.exit(main())
+
+    import tkinter as tk
+    from ui import PythonCompiler
+
     root = tk.Tk()
     app = PythonCompiler(root)
-    root.mainloop() 
\ No newline at end of file
+    root.mainloop()
\ No newline at end of file
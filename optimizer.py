@@ -0,0 +1,214 @@
+import time
+from collections import namedtuple
+from operators import BINARY_OPERATORS, UNARY_OPERATORS, COMPARE_OPERATORS
+from ir_generator import (IRProgram, Instruction, STORE, LOAD_CONST, LOAD_VAR, BINARY_OP, CALL, IF_START, JUMP,
+                          RETURN, FUNCTION, POP, DUP, UNARY_OP, COMPARE, FOR_ITER, EVAL, BEGIN, END,
+                          STORE_GLOBAL, LOAD_GLOBAL, LOAD_FREE, JUMP_OPERANDS)
+
+MAX_FOLDED_SIZE = 4096  # Largest str/bytes length or int bit length a fold may produce
+MAX_ROUNDS = 8  # Times the pass pipeline is repeated while it still finds something to change
+
+# One row of the statistics report; counts are summed over all rounds
+PassStats = namedtuple("PassStats", ["name", "changes", "removed", "seconds"])
+
+# Instructions after which the values known for variables can no longer be trusted
+_BLOCK_ENDS = {IF_START, JUMP, FOR_ITER, RETURN, FUNCTION, CALL, EVAL, BEGIN, END}
+
+_LOADS = {LOAD_VAR, LOAD_GLOBAL, LOAD_FREE}
+_STORES = {STORE, STORE_GLOBAL}
+
+
+def _too_large(value):
+    if isinstance(value, (str, bytes)):
+        return len(value) > MAX_FOLDED_SIZE
+    if isinstance(value, int):
+        return value.bit_length() > MAX_FOLDED_SIZE
+    return False
+
+
+def fold(op, left, right):
+    """Evaluate left <op> right at compile time, or raise ValueError if that is unsafe."""
+    function = BINARY_OPERATORS.get(op) or COMPARE_OPERATORS.get(op)
+    if function is None:
+        raise ValueError(f"unknown operator {op}")
+    # Refuse operations whose result (or the time to compute it) could blow up
+    if op == "Pow" and isinstance(left, int) and isinstance(right, int) and abs(right) * max(abs(left).bit_length(), 1) > MAX_FOLDED_SIZE:
+        raise ValueError("result too large")
+    if op == "LShift" and isinstance(right, int) and right > MAX_FOLDED_SIZE:
+        raise ValueError("result too large")
+    if op == "Mult" and isinstance(left, (str, bytes)) != isinstance(right, (str, bytes)):
+        sequence, count = (left, right) if isinstance(left, (str, bytes)) else (right, left)
+        if isinstance(count, int) and len(sequence) * count > MAX_FOLDED_SIZE:
+            raise ValueError("result too large")
+    if op == "Add" and isinstance(left, (str, bytes)) and isinstance(right, (str, bytes)):
+        if len(left) + len(right) > MAX_FOLDED_SIZE:
+            raise ValueError("result too large")
+    if op == "Mod" and isinstance(left, (str, bytes)):
+        # printf-style formatting: a width such as "%0300000000d" builds the whole result first
+        raise ValueError("string formatting is left to run time")
+    return _evaluate(function, left, right)
+
+
+def fold_unary(op, operand):
+    function = UNARY_OPERATORS.get(op)
+    if function is None:
+        raise ValueError(f"unknown operator {op}")
+    return _evaluate(function, operand)
+
+
+def _evaluate(function, *operands):
+    try:
+        value = function(*operands)
+    except Exception as e:  # e.g. 1 / 0 or "a" - 1; leave the error to run time
+        raise ValueError(str(e)) from e
+    if _too_large(value):
+        raise ValueError("result too large")
+    return value
+
+
+def _jump_targets(code):
+    return {instruction.operand for instruction in code if instruction is not None and instruction.opcode in JUMP_OPERANDS}
+
+
+def _compact(code):
+    """Drop removed (None) instructions and retarget jumps to the next surviving instruction."""
+    new_index = [0] * (len(code) + 1)
+    count = 0
+    for index, instruction in enumerate(code):
+        new_index[index] = count
+        if instruction is not None:
+            count += 1
+    new_index[len(code)] = count
+    compacted = []
+    for instruction in code:
+        if instruction is not None:
+            if instruction.opcode in JUMP_OPERANDS:
+                instruction = Instruction(instruction.opcode, new_index[instruction.operand], instruction.argcount)
+            compacted.append(instruction)
+    return compacted
+
+
+def copy_propagation(code):
+    """Replace loads of a variable by the constant or variable it was last assigned from.
+
+    Only applies within a basic block: any jump, jump target, function
+    boundary or call (which may rebind globals) forgets what is known.
+    """
+    targets = _jump_targets(code)
+    known = {}  # Variable -> instruction that loads its current value
+    changes = 0
+    for index, instruction in enumerate(code):
+        if index in targets:
+            known.clear()
+        opcode = instruction.opcode
+        if opcode in (LOAD_VAR, LOAD_GLOBAL):  # A function's locals and globals never share a name
+            source = known.get(instruction.operand)
+            if source is not None:
+                code[index] = Instruction(source.opcode, source.operand)
+                changes += 1
+        elif opcode in _STORES:
+            name = instruction.operand
+            # Forget the variable and every copy of it
+            known.pop(name, None)
+            for variable in [v for v, source in known.items() if source.opcode in _LOADS and source.operand == name]:
+                del known[variable]
+            previous = code[index - 1] if index else None
+            if (previous is not None and index not in targets and previous.opcode in (LOAD_CONST, LOAD_VAR, LOAD_GLOBAL)
+                    and previous.operand != name):
+                known[name] = previous
+        elif opcode in _BLOCK_ENDS:
+            known.clear()
+    return code, changes
+
+
+def constant_folding(code):
+    """Evaluate BINARY_OP, COMPARE and UNARY_OP on LOAD_CONST operands at compile time."""
+    targets = _jump_targets(code)
+    kept = []  # Indices of the instructions not yet removed
+    changes = 0
+    for index, instruction in enumerate(code):
+        opcode = instruction.opcode
+        operands = 1 if opcode == UNARY_OP else 2 if opcode in (BINARY_OP, COMPARE) else 0
+        if (operands and len(kept) >= operands and index not in targets
+                and all(code[i].opcode == LOAD_CONST for i in kept[-operands:])
+                and not targets.intersection(kept[len(kept) - operands + 1:])):
+            values = [code[i].operand for i in kept[-operands:]]
+            try:
+                value = fold_unary(instruction.operand, *values) if operands == 1 else fold(instruction.operand, *values)
+            except ValueError:
+                pass
+            else:
+                for _ in range(operands - 1):
+                    code[kept.pop()] = None
+                code[kept[-1]] = Instruction(LOAD_CONST, value)
+                code[index] = None
+                changes += 1
+                continue
+        kept.append(index)
+    return _compact(code), changes
+
+
+def dead_store_elimination(code):
+    """Remove stores to variables that are never loaded anywhere in the program.
+
+    This is the IR counterpart of the "assigned but never used" warning.
+    Stores in class bodies are kept since they define attributes. A store
+    whose value came straight from a constant or a DUP is removed together
+    with it; otherwise the value may have side effects (a name load can
+    raise NameError), so it is popped.
+    """
+    loaded = {instruction.operand for instruction in code if instruction.opcode in _LOADS or instruction.opcode == CALL}
+    targets = _jump_targets(code)
+    class_depth = 0
+    changes = 0
+    for index, instruction in enumerate(code):
+        opcode = instruction.opcode
+        if opcode in (BEGIN, END) and instruction.operand == "ClassDef":
+            class_depth += 1 if opcode == BEGIN else -1
+        if opcode not in _STORES or class_depth or instruction.operand in loaded:
+            continue
+        previous = code[index - 1] if index else None
+        if previous is not None and index not in targets and previous.opcode in (LOAD_CONST, DUP):
+            code[index - 1] = None
+            code[index] = None
+        else:
+            code[index] = Instruction(POP)
+        changes += 1
+    return _compact(code), changes
+
+
+DEFAULT_PASSES = [copy_propagation, constant_folding, dead_store_elimination]
+
+
+def optimize(program, passes=DEFAULT_PASSES):
+    """Run passes over program until nothing changes; returns the new IRProgram and a PassStats per pass."""
+    code = list(program)
+    totals = {optimization_pass.__name__: [0, 0, 0.0] for optimization_pass in passes}
+    for _ in range(MAX_ROUNDS):
+        round_changes = 0
+        for optimization_pass in passes:
+            start = time.perf_counter()
+            before = len(code)
+            code, changes = optimization_pass(code)
+            total = totals[optimization_pass.__name__]
+            total[0] += changes
+            total[1] += before - len(code)
+            total[2] += time.perf_counter() - start
+            round_changes += changes
+        if not round_changes:
+            break
+
+    optimized = IRProgram()
+    for instruction in code:
+        optimized.append(instruction)
+    return optimized, [PassStats(name, *total) for name, total in totals.items()]
+
+
+def format_stats(stats, before, after):
+    """Text report of what each pass did; before and after are instruction counts."""
+    lines = [f"{'Pass':<24}{'Changes':>9}{'Removed':>9}{'Time (ms)':>11}"]
+    for row in stats:
+        lines.append(f"{row.name:<24}{row.changes:>9}{row.removed:>9}{row.seconds * 1000:>11.2f}")
+    saved = (1 - after / before) * 100 if before else 0.0
+    lines.append(f"Instructions: {before} -> {after} ({saved:.1f}% fewer)")
+    return "\n".join(lines)
@@ -0,0 +1,192 @@
+import tkinter as tk
+import tkinter.font as tkfont
+from bisect import bisect_right
+
+TOKENS_PER_LINE = 16
+WHEEL_LINES = 3  # Lines scrolled per mouse wheel step
+
+
+class IRLines:
+    """The instructions of an IRProgram as display lines, formatted only when shown."""
+
+    def __init__(self, program):
+        self.program = program
+
+    def __len__(self):
+        return len(self.program)
+
+    def __getitem__(self, index):
+        return str(self.program.instruction(index))
+
+
+class TokenLines:
+    """A token list shown TOKENS_PER_LINE tokens per line instead of as one huge line."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def __len__(self):
+        return (len(self.tokens) + TOKENS_PER_LINE - 1) // TOKENS_PER_LINE
+
+    def __getitem__(self, index):
+        start = index * TOKENS_PER_LINE
+        return ", ".join(map(repr, self.tokens[start:start + TOKENS_PER_LINE]))
+
+
+class Document:
+    """Output text as a sequence of lines made of sections.
+
+    Each section is a list of lines or any other sequence of lines, such as
+    IRLines, so a large result is never joined into one string.
+    """
+
+    def __init__(self, *sections):
+        self.sections = [section for section in sections if len(section)]
+        self.starts = []  # Index of the first line of each section
+        total = 0
+        for section in self.sections:
+            self.starts.append(total)
+            total += len(section)
+        self.length = total
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(text.split("\n"))
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        section = bisect_right(self.starts, index) - 1
+        return self.sections[section][index - self.starts[section]]
+
+    def lines(self, start, stop):
+        """The lines from start up to (not including) stop."""
+        result = []
+        section = max(bisect_right(self.starts, start) - 1, 0)
+        while section < len(self.sections) and self.starts[section] < stop:
+            lines, offset = self.sections[section], self.starts[section]
+            first, last = max(start - offset, 0), min(stop - offset, len(lines))
+            if isinstance(lines, list):
+                result.extend(lines[first:last])
+            else:
+                result.extend(lines[index] for index in range(first, last))
+            section += 1
+        return result
+
+    def __iter__(self):
+        for section in self.sections:
+            for index in range(len(section)):
+                yield section[index]
+
+
+class VirtualOutput:
+    """Shows a Document in a ScrolledText, inserting only the lines that fit in it.
+
+    The widget holds one window of lines; scrolling (scrollbar, mouse wheel,
+    Page Up/Down, Ctrl+Home/End) replaces its contents with the window at
+    the new position, so showing a result costs the same whatever its
+    length. Lines whose first word is a key of colors are colored, with one
+    tag_add per run of same-colored lines. release() gives the widget back
+    for direct inserts, e.g. streamed program output.
+    """
+
+    def __init__(self, widget, colors):
+        self.widget = widget
+        self.colors = colors
+        self.document = None
+        self.top = 0  # Index of the first line shown
+        self.font = tkfont.Font(root=widget, font=widget.cget("font"))
+        for tag, color in colors.items():
+            widget.tag_config(tag, foreground=color)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            widget.bind(sequence, self.on_wheel, add=True)
+        for sequence, action in (("<Prior>", ("scroll", -1, "pages")), ("<Next>", ("scroll", 1, "pages")),
+                                 ("<Control-Home>", ("moveto", 0)), ("<Control-End>", ("moveto", 1))):
+            widget.bind(sequence, lambda event, action=action: self.on_key(action), add=True)
+        widget.bind("<Configure>", lambda event: self.render(), add=True)
+
+    @property
+    def active(self):
+        return self.document is not None
+
+    def show(self, document):
+        if not self.active:
+            self.widget.vbar.config(command=self.yview)
+            self.widget.config(yscrollcommand="")
+        self.document = document
+        self.top = 0
+        self.render()
+
+    def release(self):
+        """Clear the widget and let it scroll its own contents again."""
+        if self.active:
+            self.document = None
+            self.widget.vbar.config(command=self.widget.yview)
+            self.widget.config(yscrollcommand=self.widget.vbar.set)
+        self.widget.config(state=tk.NORMAL)
+        self.widget.delete("1.0", tk.END)
+        self.widget.config(state=tk.DISABLED)
+
+    def rows(self):
+        return max(self.widget.winfo_height() // self.font.metrics("linespace"), 1)
+
+    def last_top(self):
+        return max(len(self.document) - self.rows(), 0)
+
+    def render(self):
+        if not self.active:
+            return
+        rows = self.rows()
+        self.top = min(self.top, self.last_top())
+        lines = self.document.lines(self.top, self.top + rows)
+
+        widget = self.widget
+        widget.config(state=tk.NORMAL)
+        widget.delete("1.0", tk.END)
+        widget.insert("1.0", "\n".join(lines))
+        run_start, run_tag = 0, None
+        for index in range(len(lines) + 1):
+            tag = None
+            if index < len(lines):
+                words = lines[index].split(None, 1)
+                tag = words[0] if words and words[0] in self.colors else None
+            if tag != run_tag or index == len(lines):
+                if run_tag:
+                    widget.tag_add(run_tag, f"{run_start + 1}.0", f"{index}.end")
+                run_start, run_tag = index, tag
+        if self.top and self.top == self.last_top():
+            widget.see(tk.END)  # Wrapped lines may push the last ones out of view
+        widget.config(state=tk.DISABLED)
+
+        total = max(len(self.document), 1)
+        widget.vbar.set(self.top / total, min((self.top + rows) / total, 1.0))
+
+    def scroll_to(self, top):
+        top = max(min(int(top), self.last_top()), 0)
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    def yview(self, action, amount, unit=None):
+        # Scrollbar protocol: ("moveto", fraction) or ("scroll", count, "units" | "pages")
+        if action == "moveto":
+            self.scroll_to(float(amount) * len(self.document))
+        elif action == "scroll":
+            step = self.rows() if unit == "pages" else 1
+            self.scroll_to(self.top + int(amount) * step)
+
+    def on_wheel(self, event):
+        if not self.active:
+            return None
+        if event.num == 4 or getattr(event, "delta", 0) > 0:
+            self.scroll_to(self.top - WHEEL_LINES)
+        else:
+            self.scroll_to(self.top + WHEEL_LINES)
+        return "break"
+
+    def on_key(self, action):
+        if not self.active:
+            return None
+        self.yview(*action)
+        return "break"
@@ -0,0 +1,103 @@
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+def untimed(name, category="stage"):
+    """Stand-in for Profiler.stage when no profiler is given."""
+    return nullcontext()
+
+
+class Profiler:
+    """Records wall time, CPU time and allocations of pipeline stages.
+
+    Wrap each stage in `with profiler.stage(name):`; stages may nest and may
+    run on any thread. CPU time is that of the calling thread, allocations
+    are the net number of memory blocks the stage left allocated. Stages
+    named in cprofile also run under cProfile, accumulated per stage name.
+    """
+
+    def __init__(self, cprofile=()):
+        self.origin = time.perf_counter()
+        self.spans = []  # (name, category, thread id, start, wall, cpu, allocations); start is relative to origin
+        self.cprofile = set(cprofile)
+        self.profiles = {}  # Stage name -> cProfile.Profile
+        self.profiling = False  # Only one cProfile.Profile can be active at a time
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, category="stage"):
+        profile = None
+        if name in self.cprofile and not self.profiling:
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+            self.profiling = True
+            profile.enable()
+        blocks = sys.getallocatedblocks()
+        cpu = time.thread_time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.thread_time() - cpu
+            allocations = sys.getallocatedblocks() - blocks
+            if profile is not None:
+                profile.disable()
+                self.profiling = False
+            with self.lock:
+                self.spans.append((name, category, threading.get_ident(), start - self.origin, wall, cpu, allocations))
+
+    def summary(self):
+        """(name, calls, wall, cpu, allocations) per stage name, in order of first use."""
+        totals = {}
+        with self.lock:
+            spans = list(self.spans)
+        for name, _, _, start, wall, cpu, allocations in sorted(spans, key=lambda span: span[3]):
+            row = totals.setdefault(name, [name, 0, 0.0, 0.0, 0])
+            row[1] += 1
+            row[2] += wall
+            row[3] += cpu
+            row[4] += allocations
+        return [tuple(row) for row in totals.values()]
+
+    def report(self):
+        lines = [f"{'Stage':<24}{'Calls':>7}{'Wall (ms)':>11}{'CPU (ms)':>10}{'Allocs':>10}"]
+        for name, calls, wall, cpu, allocations in self.summary():
+            lines.append(f"{name:<24}{calls:>7}{wall * 1000:>11.2f}{cpu * 1000:>10.2f}{allocations:>10}")
+        return "\n".join(lines)
+
+    def profile_stats(self, name, limit=25):
+        """cProfile statistics of a stage, sorted by cumulative time."""
+        profile = self.profiles.get(name)
+        if profile is None:
+            return f"No cProfile data for {name}"
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def chrome_trace(self):
+        """The spans as Chrome trace-event JSON (load in chrome://tracing or Perfetto)."""
+        pid = os.getpid()
+        with self.lock:
+            spans = list(self.spans)
+        events = [{
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": wall * 1e6,
+            "pid": pid,
+            "tid": thread,
+            "args": {"cpu_ms": cpu * 1000, "allocations": allocations},
+        } for name, category, thread, start, wall, cpu, allocations in spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.chrome_trace(), file)
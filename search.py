@@ -0,0 +1,89 @@
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+
+_NEWLINE = re.compile("\n")
+
+
+def compile_pattern(pattern, regex=False, whole_word=False):
+    """The compiled search pattern; plain text is escaped. Raises re.error for a bad regex."""
+    if not regex:
+        pattern = re.escape(pattern)
+    if whole_word:
+        pattern = rf"\b(?:{pattern})\b"
+    return re.compile(pattern, re.MULTILINE)
+
+
+class SearchIndex:
+    """The matches of a pattern in a snapshot of the text_area buffer.
+
+    Line start offsets are indexed once, so an offset converts to a Tk
+    "line.column" position with a bisect. Matches are found lazily, in
+    order, only as far as has been asked for, so showing the matches near
+    the top of a huge file does not scan all of it.
+    """
+
+    def __init__(self, text, pattern, regex=False, whole_word=False):
+        self.text = text
+        self.pattern = compile_pattern(pattern, regex, whole_word)
+        self.regex = regex
+        self.line_starts = array("q", [0])
+        self.line_starts.extend(match.end() for match in _NEWLINE.finditer(text))
+        self.starts = array("q")  # Matches found so far, as (start, end) offsets
+        self.ends = array("q")
+        self.matches = self.pattern.finditer(text)
+        self.done = False
+        self.scanned = 0  # Every match starting before this offset has been found
+
+    def extend(self, offset):
+        """Find matches until one starts at or after offset (or the text ends)."""
+        while not self.done and self.scanned <= offset:
+            match = next(self.matches, None)
+            if match is None:
+                self.done = True
+                self.scanned = len(self.text) + 1
+                break
+            self.starts.append(match.start())
+            self.ends.append(match.end())
+            self.scanned = match.start() + 1
+
+    def __len__(self):
+        """The number of matches; finds all of them."""
+        self.extend(len(self.text))
+        return len(self.starts)
+
+    def between(self, start, stop):
+        """Indices of the matches overlapping the offsets start to stop."""
+        self.extend(stop)
+        return range(bisect_right(self.ends, start), bisect_left(self.starts, stop))
+
+    def next_after(self, offset):
+        """Index of the first match starting at or after offset, wrapping around, or None."""
+        self.extend(offset)
+        index = bisect_left(self.starts, offset)
+        if index < len(self.starts):
+            return index
+        return 0 if self.starts else None
+
+    def position(self, offset):
+        """The Tk index of a character offset."""
+        line = bisect_right(self.line_starts, offset) - 1
+        return f"{line + 1}.{offset - self.line_starts[line]}"
+
+    def offset(self, position):
+        """The character offset of a Tk "line.column" index."""
+        line, column = map(int, position.split("."))
+        return self.line_starts[line - 1] + column
+
+    def span(self, index):
+        return self.position(self.starts[index]), self.position(self.ends[index])
+
+    def replacements(self, replacement):
+        """(start, end, new text) for every match, last first, so applying them in order keeps earlier offsets valid."""
+        edits = []
+        for match in self.pattern.finditer(self.text):
+            new = match.expand(replacement) if self.regex else replacement
+            if new != match.group():
+                edits.append((match.start(), match.end(), new))
+        edits.reverse()
+        return edits
@@ -1,77 +1,328 @@
 import ast
+from operators import BINARY_OPERATORS
+from symbols import SymbolTable, BUILTIN_NAMES, FUNCTION, CLASS, COMPREHENSION
+from visitor import AnalysisPass, run_passes
+
+# A value of each constant type, to check whether an operation between two types can work
+_SAMPLE_VALUES = {"int": 1, "float": 1.0, "complex": 1j, "bool": True, "str": "s", "bytes": b"s", "NoneType": None}
+
+
+def _target_names(target):
+    """The Name nodes an assignment target binds; attributes and subscripts bind none."""
+    stack = [target]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Name):
+            yield node
+        elif isinstance(node, (ast.Tuple, ast.List)):
+            stack.extend(reversed(node.elts))
+        elif isinstance(node, ast.Starred):
+            stack.append(node.value)
+
+
+def _parameters(args):
+    names = [arg.arg for arg in args.posonlyargs + args.args]
+    positional = len(names)
+    if args.vararg:
+        names.append(args.vararg.arg)
+    names.extend(arg.arg for arg in args.kwonlyargs)
+    if args.kwarg:
+        names.append(args.kwarg.arg)
+    return names, (positional - len(args.defaults), None if args.vararg else positional)
+
+
+def _position(node):
+    return node.lineno, node.col_offset, node.end_lineno, node.end_col_offset
 
-def semantic_analyzer(tree):
-    errors = []
-    warnings = []
-    variables = {}  # Tracks variables and their types
-    functions = {}  # Tracks function definitions and argument counts
-    used_variables = set()  # Tracks variables that are used
 
-    predefined_functions = {"print", "len", "range", "int", "str", "float", "bool", "list", "dict", "set"}
+class SemanticPass(AnalysisPass):
+    """Checks names, calls and operations against a scope-aware symbol table.
 
-    def get_type(node):
+    Code at module or class level runs in order, so a name must be bound
+    before it is read. Code in functions runs when they are called, so
+    names they cannot resolve yet are checked once the whole module has
+    been seen (module_diagnostics).
+    """
+
+    def __init__(self, state=None, undo_log=None):
+        self.errors = []
+        self.warnings = []
+        self.symbols = SymbolTable()
+        self.used = set()  # (scope, name) of every binding that is read
+        self.unresolved = []  # (scope, name, called, positional args, position) read in functions before being bound
+        if state is not None:  # Continue (in place) from the symbols of earlier code
+            self.symbols, self.used, self.unresolved = state
+        self.undo_log = undo_log  # Records every symbol change so it can be rolled back
+        self.symbols.undo_log = undo_log
+        self.pending = set()  # ids of Name nodes bound once the rest of their statement is evaluated
+        self.callees = set()  # ids of Name nodes that are called, so checked as functions
+        self.locations = None  # If a list, the position of the node each error is about, in step with errors
+
+    @property
+    def state(self):
+        return self.symbols, self.used, self.unresolved
+
+    def get_type(self, node):
         """Determine the type of a node."""
         if isinstance(node, ast.Constant):
             return type(node.value).__name__
         elif isinstance(node, ast.Name):
-            return variables.get(node.id, None)  # Return stored type if available
+            symbol = self.symbols.resolve(node.id)[1]
+            return symbol.type if symbol is not None else None  # Return stored type if available
         return None
 
-    for node in ast.walk(tree):
-        # Track variable assignments
-        if isinstance(node, ast.Assign):
-            for target in node.targets:
-                if isinstance(target, ast.Name):
-                    var_name = target.id
-                    value_type = get_type(node.value)
-
-                    if var_name in variables:
-                        warnings.append(f"Warning: Variable '{var_name}' is redefined.")
-
-                    variables[var_name] = value_type  # Store type instead of just tracking existence
-        
-        # Detect usage of undefined variables
-        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
-            if node.id not in variables and node.id not in predefined_functions:
-                errors.append(f"Undefined variable: '{node.id}'")
+    def bind(self, name, kind="binding", value_type=None, params=None, scope=None):
+        return self.symbols.define(name, kind, value_type, params, scope)
+
+    def assign(self, name, value_type=None, scope=None):
+        scope, previous = self.bind(name, "variable", value_type, scope=scope)
+        if previous is not None and previous.kind == "variable":
+            self.warnings.append(f"Warning: Variable '{name}' is redefined.")
+
+    def report(self, errors, node):
+        self.errors.extend(errors)
+        if self.locations is not None:
+            self.locations.extend(_position(node) for _ in errors)
+
+    def use(self, scope, name):
+        if (scope, name) not in self.used:
+            self.symbols.record(self.used, (scope, name))
+            self.used.add((scope, name))
+
+    def load(self, node, name, called=False, given=None):
+        """Check a read of name at node; given is the number of positional arguments if it is called with only those."""
+        scope, symbol = self.symbols.resolve(name)
+        if symbol is not None:
+            self.use(scope, name)
+            if called:
+                self.report(self.call_errors(symbol, given), node)
+        elif name in BUILTIN_NAMES:
+            pass
+        elif self.symbols.current.in_function:  # May be bound later, before the function is called
+            self.symbols.record(self.unresolved)
+            self.unresolved.append((self.symbols.current, name, called, given, _position(node)))
+        elif self.symbols.resolve("*")[1] is None:
+            self.report([self.undefined(name, called)], node)
+
+    @staticmethod
+    def undefined(name, called):
+        if called:
+            return f"Error: Undefined function '{name}' called."
+        return f"Undefined variable: '{name}'"
+
+    @staticmethod
+    def call_errors(symbol, given):
+        if symbol.params is None or given is None:
+            return []
+        minimum, maximum = symbol.params
+        if minimum <= given and (maximum is None or given <= maximum):
+            return []
+        if minimum == maximum:
+            expected = minimum
+        elif maximum is None:
+            expected = f"at least {minimum}"
+        else:
+            expected = f"{minimum} to {maximum}"
+        return [f"Error: Function '{symbol.name}' expects {expected} arguments, but {given} were given."]
+
+    # Bindings are made once the value they bind has been evaluated
+    def visit_Assign(self, node):
+        for target in node.targets:
+            self.pending.update(id(name) for name in _target_names(target))
+
+    def leave_Assign(self, node):
+        value_type = self.get_type(node.value)
+        for target in node.targets:
+            for name in _target_names(target):
+                self.pending.discard(id(name))
+                self.assign(name.id, value_type if name is target else None)  # Store type instead of just tracking existence
+
+    def visit_AugAssign(self, node):
+        if isinstance(node.target, ast.Name):
+            self.pending.add(id(node.target))
+            self.load(node.target, node.target.id)
+
+    def leave_AugAssign(self, node):
+        self.pending.discard(id(node.target))
+
+    def visit_AnnAssign(self, node):
+        if isinstance(node.target, ast.Name):
+            self.pending.add(id(node.target))
+
+    def leave_AnnAssign(self, node):
+        if isinstance(node.target, ast.Name):
+            self.pending.discard(id(node.target))
+            if node.value is not None:  # A bare annotation binds nothing
+                self.assign(node.target.id, self.get_type(node.value))
+
+    def visit_NamedExpr(self, node):
+        self.pending.add(id(node.target))
+
+    def leave_NamedExpr(self, node):
+        self.pending.discard(id(node.target))
+        scope = self.symbols.current
+        while scope.kind == COMPREHENSION:  # := in a comprehension binds in the enclosing scope
+            scope = scope.parent
+        self.assign(node.target.id, self.get_type(node.value), scope)
+
+    def visit_For(self, node):
+        self.pending.update(id(name) for name in _target_names(node.target))
+
+    def after_For_iter(self, node):
+        for name in _target_names(node.target):
+            self.pending.discard(id(name))
+            self.bind(name.id)
+
+    visit_AsyncFor = visit_For
+    after_AsyncFor_iter = after_For_iter
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.bind(alias.asname or alias.name.split(".")[0], "import")
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            self.bind(alias.asname or alias.name, "import")  # "*" marks that any name may be defined
+
+    def visit_Global(self, node):
+        self.symbols.declare(node.names)
+
+    def visit_Nonlocal(self, node):
+        self.symbols.declare(node.names, nonlocal_=True)
+
+    def visit_ExceptHandler(self, node):
+        if node.name:
+            self.bind(node.name)
+
+    def visit_MatchAs(self, node):
+        if node.name:
+            self.bind(node.name)
+
+    def visit_MatchStar(self, node):
+        if node.name:
+            self.bind(node.name)
+
+    def visit_MatchMapping(self, node):
+        if node.rest:
+            self.bind(node.rest)
+
+    # Detect usage of undefined variables
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            if id(node) in self.callees:
+                self.callees.discard(id(node))
             else:
-                used_variables.add(node.id)  # Track that this variable is used
+                self.load(node, node.id)
+        elif isinstance(node.ctx, ast.Store) and id(node) not in self.pending:
+            self.bind(node.id)  # e.g. with ... as name
 
+    def visit_BinOp(self, node):
         # Division by zero check
-        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div):
-            right_type = get_type(node.right)
+        if isinstance(node.op, ast.Div):
+            right_type = self.get_type(node.right)
             if right_type == "int" and isinstance(node.right, ast.Constant) and node.right.value == 0:
-                errors.append("Error: Division by zero detected.")
+                self.report(["Error: Division by zero detected."], node)
 
         # Type checking for binary operations
-        elif isinstance(node, ast.BinOp):
-            left_type = get_type(node.left)
-            right_type = get_type(node.right)
-
-            if left_type and right_type and left_type != right_type:
-                errors.append(f"Type Error: Cannot perform operation between {left_type} and {right_type}.")
-
-        # Function definitions
-        elif isinstance(node, ast.FunctionDef):
-            func_name = node.name
-            arg_count = len(node.args.args)
-            functions[func_name] = arg_count
-        
-        # Function call validation
-        elif isinstance(node, ast.Call):
-            if isinstance(node.func, ast.Name):
-                func_name = node.func.id
-                if func_name not in functions and func_name not in predefined_functions:
-                    errors.append(f"Error: Undefined function '{func_name}' called.")
-                elif func_name in functions:
-                    expected_args = functions[func_name]
-                    given_args = len(node.args)
-                    if expected_args != given_args:
-                        errors.append(f"Error: Function '{func_name}' expects {expected_args} arguments, but {given_args} were given.")
-
-    # Check for unused variables
-    for var in variables.keys():
-        if var not in used_variables:
-            warnings.append(f"Warning: Variable '{var}' is assigned but never used.")
-
-    return errors, warnings
+        else:
+            left_type = self.get_type(node.left)
+            right_type = self.get_type(node.right)
+
+            if (left_type in _SAMPLE_VALUES and right_type in _SAMPLE_VALUES
+                    and not (isinstance(node.op, ast.Mod) and left_type in ("str", "bytes"))):  # "%d" % 5 formats
+                try:
+                    BINARY_OPERATORS[type(node.op).__name__](_SAMPLE_VALUES[left_type], _SAMPLE_VALUES[right_type])
+                except TypeError:
+                    self.report([f"Type Error: Cannot perform operation between {left_type} and {right_type}."], node)
+                except Exception:
+                    pass
+
+    # Scopes: parameters, defaults and decorators are evaluated outside the function's own scope
+    def visit_FunctionDef(self, node):
+        self.bind(node.name, "function", params=_parameters(node.args)[1])
+
+    def after_FunctionDef_args(self, node):
+        self.symbols.enter(FUNCTION, node.name)
+        for name in _parameters(node.args)[0]:
+            self.bind(name, "parameter")
+
+    def after_FunctionDef_body(self, node):
+        self.symbols.leave()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+    after_AsyncFunctionDef_args = after_FunctionDef_args
+    after_AsyncFunctionDef_body = after_FunctionDef_body
+
+    def after_Lambda_args(self, node):
+        self.symbols.enter(FUNCTION, "<lambda>")
+        for name in _parameters(node.args)[0]:
+            self.bind(name, "parameter")
+
+    def leave_Lambda(self, node):
+        self.symbols.leave()
+
+    def after_ClassDef_keywords(self, node):
+        self.symbols.enter(CLASS, node.name)
+
+    def after_ClassDef_body(self, node):
+        self.symbols.leave()
+
+    def leave_ClassDef(self, node):
+        self.bind(node.name, "class")
+
+    def visit_ListComp(self, node):
+        # The loop targets are bound before the element, which comes first in the tree, is evaluated
+        self.symbols.enter(COMPREHENSION, type(node).__name__)
+        for generator in node.generators:
+            for name in _target_names(generator.target):
+                self.pending.add(id(name))
+                self.bind(name.id)
+
+    def leave_ListComp(self, node):
+        for generator in node.generators:
+            self.pending.difference_update(id(name) for name in _target_names(generator.target))
+        self.symbols.leave()
+
+    visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_ListComp
+    leave_SetComp = leave_DictComp = leave_GeneratorExp = leave_ListComp
+
+    # Function call validation
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Name):
+            self.callees.add(id(node.func))
+            plain = not node.keywords and not any(isinstance(arg, ast.Starred) for arg in node.args)
+            self.load(node.func, node.func.id, called=True, given=len(node.args) if plain else None)
+
+    def module_diagnostics(self, locations=None):
+        """Errors and warnings that need the whole module: names read in functions and unused variables.
+
+        The position of each error is appended to locations, if given.
+        """
+        errors = []
+        used = set(self.used)
+        for scope, name, called, given, position in self.unresolved:
+            owner, symbol = self.symbols.resolve(name, scope)
+            found = []
+            if symbol is not None:
+                used.add((owner, name))
+                if called:
+                    found = self.call_errors(symbol, given)
+            elif self.symbols.resolve("*", scope)[1] is None:
+                found = [self.undefined(name, called)]
+            errors.extend(found)
+            if locations is not None:
+                locations.extend(position for _ in found)
+        # Check for unused variables; class-level names are attributes
+        warnings = [f"Warning: Variable '{name}' is assigned but never used."
+                    for scope in self.symbols.module.walk() if scope.kind != CLASS
+                    for name, symbol in scope.symbols.items()
+                    if symbol.kind == "variable" and (scope, name) not in used and not name.startswith("_")]
+        return errors, warnings
+
+    def finish(self):
+        errors, warnings = self.module_diagnostics(self.locations)
+        return self.errors + errors, self.warnings + warnings
+
+
+def semantic_analyzer(tree):
+    return run_passes(tree, [SemanticPass()])[0]
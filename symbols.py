@@ -0,0 +1,204 @@
+import sys
+import builtins
+
+MODULE, FUNCTION, CLASS, COMPREHENSION = "module", "function", "class", "comprehension"
+
+# Names every module can use without defining them
+BUILTIN_NAMES = frozenset(dir(builtins)) | {"__file__", "__builtins__"}
+
+_MISSING = object()
+
+
+class Symbol:
+    """A name bound in a scope.
+
+    kind is what bound it ("variable", "parameter", "function", "class",
+    "import" or "binding" for for-loop targets, except-as names and the
+    like); type is the type name of an assigned constant, if known, and
+    params the (minimum, maximum) positional arguments of a function, with
+    None as maximum if it takes *args.
+    """
+
+    __slots__ = ("name", "kind", "type", "params")
+
+    def __init__(self, name, kind, type=None, params=None):
+        self.name = name
+        self.kind = kind
+        self.type = type
+        self.params = params
+
+    def __repr__(self):
+        return f"Symbol({self.name!r}, {self.kind!r})"
+
+
+class Scope:
+    """One module, function (or lambda), class or comprehension scope."""
+
+    __slots__ = ("kind", "name", "parent", "in_function", "symbols", "children", "globals", "nonlocals", "cache")
+
+    def __init__(self, kind, name, parent=None):
+        self.kind = kind
+        self.name = name
+        self.parent = parent
+        # Code in a function (or nested in one) only runs once it is called
+        self.in_function = kind == FUNCTION or (parent is not None and parent.in_function)
+        self.symbols = {}  # name -> Symbol, in binding order
+        self.children = []
+        self.globals = set()  # Names declared global here
+        self.nonlocals = set()
+        self.cache = {}  # name -> (version of the name, (scope, Symbol)) found through the parents
+
+    def walk(self):
+        """Yield this scope and every scope nested in it, parents first."""
+        stack = [self]
+        while stack:
+            scope = stack.pop()
+            yield scope
+            stack.extend(reversed(scope.children))
+
+    def __repr__(self):
+        return f"Scope({self.kind!r}, {self.name!r})"
+
+
+class SymbolTable:
+    """Hierarchical symbol table, built while walking the tree in order.
+
+    The walk calls enter() and leave() around every scope and define() for
+    every binding, so at any point the table holds the names bound so far.
+    resolve() follows Python's rules: the current scope, then the enclosing
+    function scopes (class bodies are skipped) up to the module. Names are
+    interned, and the result of each walk up the parents is cached in the
+    scope it started from. Every name has a version that changes whenever it
+    is bound anywhere, so a cached result is used only while it is current.
+
+    Changes can be recorded in an undo log as (container, key, previous)
+    entries, see undo_symbols(). Versions are never restored: undoing or
+    redoing a binding gives the name a new version instead, so no cached
+    result from before can be taken as current.
+    """
+
+    def __init__(self):
+        self.module = Scope(MODULE, "<module>")
+        self.current = self.module
+        self.versions = {}  # name -> version, taken from clock when the name is bound
+        self.clock = 0
+        self.undo_log = None
+
+    def record(self, container, key=None):
+        """Add the coming change of container[key] (or append to a list) to the undo log."""
+        if self.undo_log is not None:
+            self.undo_log.append((container, key, container.get(key, _MISSING) if isinstance(container, dict) else _MISSING))
+
+    def enter(self, kind, name):
+        scope = Scope(kind, name, self.current)
+        self.record(self.current.children)
+        self.current.children.append(scope)
+        self.current = scope
+        return scope
+
+    def leave(self):
+        self.current = self.current.parent
+
+    def declare(self, names, nonlocal_=False):
+        """Handle a global or nonlocal statement in the current scope."""
+        declared = self.current.nonlocals if nonlocal_ else self.current.globals
+        for name in names:
+            name = sys.intern(name)
+            if name not in declared:
+                self.record(declared, name)
+                declared.add(name)
+
+    def binding_scope(self, name, scope=None):
+        """The scope a binding of name in scope (default: the current one) goes to."""
+        scope = scope or self.current
+        if name in scope.globals:
+            return self.module
+        if name in scope.nonlocals:
+            owner = self.resolve(name, scope)[0]
+            if owner is not None and owner.kind == FUNCTION:
+                return owner
+        return scope
+
+    def define(self, name, kind, type=None, params=None, scope=None):
+        """Bind name and return (scope it was bound in, previous Symbol there or None)."""
+        name = sys.intern(name)
+        scope = self.binding_scope(name, scope)
+        previous = scope.symbols.get(name)
+        self.record(scope.symbols, name)
+        scope.symbols[name] = Symbol(name, kind, type, params)
+        if self.undo_log is not None:
+            self.undo_log.append((self, name, _MISSING))
+        self.new_version(name)
+        return scope, previous
+
+    def new_version(self, name):
+        self.clock += 1
+        self.versions[name] = self.clock
+
+    def resolve(self, name, scope=None):
+        """(scope, Symbol) the name refers to from scope (default: the current one), or (None, None)."""
+        scope = scope or self.current
+        if name not in scope.globals and name not in scope.nonlocals:
+            symbol = scope.symbols.get(name)
+            if symbol is not None:
+                return scope, symbol
+        version = self.versions.get(name)
+        cached = scope.cache.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        found = self._lookup(name, scope)
+        scope.cache[name] = (version, found)
+        return found
+
+    def _lookup(self, name, scope):
+        if name in scope.globals:
+            symbol = self.module.symbols.get(name)
+            return (self.module, symbol) if symbol is not None else (None, None)
+        scope = scope.parent
+        while scope is not None:
+            if scope.kind != CLASS:
+                if name in scope.globals:
+                    return self._lookup(name, scope)
+                symbol = scope.symbols.get(name)
+                if symbol is not None:
+                    return scope, symbol
+            scope = scope.parent
+        return None, None
+
+
+def undo_symbols(undo_log, redo_log=None):
+    """Roll symbol tables back over the changes recorded in undo_log.
+
+    With a redo_log list, the values rolled back are added to it so
+    redo_symbols() can make the same changes again.
+    """
+    for container, key, previous in reversed(undo_log):
+        if isinstance(container, SymbolTable):  # A binding of key changed
+            container.new_version(key)
+            if redo_log is not None:
+                redo_log.append((container, key, None))
+            continue
+        if redo_log is not None:
+            redo_log.append((container, key, container[key] if isinstance(container, dict) else
+                             container[-1] if isinstance(container, list) else key))
+        if previous is not _MISSING:
+            container[key] = previous
+        elif isinstance(container, dict):
+            del container[key]
+        elif isinstance(container, list):
+            container.pop()
+        else:
+            container.discard(key)
+
+
+def redo_symbols(redo_log):
+    """Make the changes rolled back by undo_symbols() again."""
+    for container, key, value in reversed(redo_log):
+        if isinstance(container, SymbolTable):
+            container.new_version(key)
+        elif isinstance(container, dict):
+            container[key] = value
+        elif isinstance(container, list):
+            container.append(value)
+        else:
+            container.add(key)
@@ -0,0 +1,53 @@
+import queue
+import pytest
+from execution import WorkerPool, _Worker, DEFAULT_MAX_OUTPUT_LINES
+import grader
+
+
+def test_worker_that_starts_late_is_used_and_kept(monkeypatch):
+    pool = WorkerPool(size=1, timeout=5)
+    try:
+        pool.idle.queue[0].kill()  # Forces a restart whose "ready" arrives after wait_ready gave up
+        original = _Worker.wait_ready
+
+        def late(worker, timeout):
+            if not worker.ready:
+                raise queue.Empty
+            return original(worker, timeout)
+
+        monkeypatch.setattr(_Worker, "wait_ready", late)
+        result = pool.run("print(1)\n")
+        assert (result.exit_code, result.stdout) == (0, "1\n")
+        assert pool.idle.qsize() == 1
+        monkeypatch.setattr(_Worker, "wait_ready", original)
+        assert pool.run("print(2)\n").stdout == "2\n"
+    finally:
+        pool.close()
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = WorkerPool(size=1, timeout=5)
+    yield pool
+    pool.close()
+
+
+def test_stdin_is_the_real_standard_input(pool):
+    for code in ["import sys\nprint(len(sys.stdin.buffer.read()))\n", "print(len(open(0).read()))\n",
+                 "print(len(input() + input()) + 2)\n"]:
+        assert pool.run(code, stdin="ab\ncd\n").stdout == "6\n"
+
+
+def test_jobs_do_not_see_each_others_module_changes(pool):
+    pool.run("import builtins, math, sys\nbuiltins.print = None\nbuiltins.extra = 1\nmath.pi = 3\n"
+             "sys.setrecursionlimit(50)\n")
+    result = pool.run("import math, sys\nprint(hasattr(__builtins__, 'extra'), math.pi, sys.getrecursionlimit() > 50)\n")
+    assert result.stdout == "False 3.141592653589793 True\n"
+
+
+def test_grading_judges_the_whole_output():
+    lines = 2 * DEFAULT_MAX_OUTPUT_LINES
+    expected = "".join(f"{i}\n" for i in range(lines))
+    [result] = grader.grade(f"for i in range({lines}):\n    print(i)\n", [grader.TestCase("long", "", expected)], workers=1)
+    assert result.passed
+    assert result.stdout.startswith("[... truncated")
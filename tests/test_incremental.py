@@ -0,0 +1,75 @@
+import random
+import warnings
+import pytest
+from incremental import IncrementalEngine, split_chunks
+from parser_module import parser
+from semantic import semantic_analyzer
+from ir_generator import generate_ir
+
+pytestmark = pytest.mark.filterwarnings("ignore::SyntaxWarning")  # e.g. "1x" from random edits
+
+STATEMENTS = [
+    "x = 1\n", "y = x + 1\n", "def f(a):\n    return a + z\n", "z = 2\n", "print(f(y))\n", "unused = 3\n",
+    "class A:\n    q = unused\n", "if x:\n    k = 1\nelse:\n    k = 2\n", "print(k)\n", "global g\n", "import os\n",
+    "v = os.path\n", "f(1, 2)\n", "t = 1 + \\\n2\n", "s = 'a\\\nb'\n", "u = (\n1)\n", "@dec\ndef h():\n    pass\n",
+    "broken(\n", "def h():\n    x = 1\n", "def g():\n    global x\n    x = 2\n", "for x in range(3):\n    pass\n",
+    "x += 1\n", "def k():\n    def m():\n        return x\n    return m\n",
+]
+
+
+def assert_matches_fresh(result, code):
+    """The incremental result agrees with one parse and walk of the whole buffer."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", SyntaxWarning)
+            tree = parser(code)
+    except SyntaxError:
+        assert result.syntax_error is not None, code
+        return
+    assert result.syntax_error is None, code
+    errors, found_warnings = semantic_analyzer(tree)
+    assert sorted(result.errors) == sorted(errors), code
+    assert sorted(result.warnings) == sorted(found_warnings), code
+    assert result.ir_code == "\n".join(generate_ir(tree).lines()), code
+
+
+def test_backslash_continuation_stays_in_one_statement():
+    code = "x = 1 + \\\n2\nprint(x)\n"
+    assert split_chunks(code) == ["x = 1 + \\\n2\n", "print(x)\n"]
+    assert_matches_fresh(IncrementalEngine().update(code), code)
+
+
+def test_replayed_chunk_after_a_function_binding_the_same_name():
+    engine = IncrementalEngine()
+    for code in ["def h():\n    pass\nx = 3\n", "def h():\n   x = 1\nx = 3\n", "", "x = 3\nprint(x)\n"]:
+        assert_matches_fresh(engine.update(code), code)
+
+
+@pytest.mark.parametrize("seed", range(16))
+def test_random_edits_match_fresh_analysis(seed):
+    rng = random.Random(seed)
+    engine = IncrementalEngine()
+    for _ in range(200):
+        if engine.code and rng.random() < 0.6:
+            start = rng.randint(0, len(engine.code))
+            code = engine.code[:start] + rng.choice(STATEMENTS + ["", "x", "1", "\n"]) + \
+                engine.code[start + rng.randint(0, 3):]
+        else:
+            code = "".join(rng.choice(STATEMENTS) for _ in range(rng.randint(0, 12)))
+        assert_matches_fresh(engine.update(code), code)
+
+
+def test_edit_that_keeps_module_names_is_not_reanalyzed_to_the_end():
+    code = "".join(f"def f{i}(a):\n    return a + {i}\nprint(f{i}(1))\n" for i in range(200))
+    engine = IncrementalEngine()
+    engine.update(code)
+    edited = code.replace("return a + 0", "return a + 10", 1)
+    result = engine.update(edited)
+    assert result.reanalyzed == 1
+    assert_matches_fresh(result, edited)
+
+    # A changed signature is seen by every later call, so they are all analyzed again
+    edited = edited.replace("def f0(a)", "def f0(a, b)", 1)
+    result = engine.update(edited)
+    assert result.reanalyzed == len(result.chunks)
+    assert_matches_fresh(result, edited)
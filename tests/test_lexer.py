@@ -0,0 +1,21 @@
+import random
+from lexer import tokenize, tokenize_bytes, lexer
+
+PIECES = ["é", "x", " ", "'ü'", "\n", "1", "+", "ß = 2", '"""a\nö"""', "#ç\n", "\\\n", "'a\\\nü'", "€"]
+
+
+def test_tokenize_bytes_matches_tokenize():
+    rng = random.Random(0)
+    for _ in range(2000):
+        code = "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 30)))
+        assert list(tokenize_bytes(code.encode())) == list(tokenize(code)), code
+
+
+def test_backslash_newline_inside_a_string():
+    tokens = list(tokenize('s = "ab\\\ncd"\nt = 1\n'))
+    assert [token.kind for token in tokens] == ["NAME", "OP", "STRING", "NAME", "OP", "NUMBER"]
+    assert tokens[3].line == 3
+
+
+def test_lexer_skips_invalid_tokens():
+    assert lexer(None, "é = 1\n") == ["=", "1"]
@@ -0,0 +1,33 @@
+import time
+import pytest
+from optimizer import fold, optimize, MAX_FOLDED_SIZE
+from ir_generator import generate_ir, LOAD_CONST
+from parser_module import parser
+
+
+@pytest.mark.parametrize("op, left, right", [
+    ("Mod", "%0300000000d", 1),
+    ("Mod", b"%0300000000d", 1),
+    ("Mod", "%s", "x"),
+    ("Pow", 10, 10 ** 8),
+    ("LShift", 1, 10 ** 9),
+    ("Mult", "ab", 10 ** 9),
+    ("Add", "a" * MAX_FOLDED_SIZE, "b"),
+])
+def test_fold_refuses_large_or_formatting_results_before_computing_them(op, left, right):
+    start = time.perf_counter()
+    with pytest.raises(ValueError):
+        fold(op, left, right)
+    assert time.perf_counter() - start < 0.5
+
+
+def test_fold_still_folds_small_arithmetic():
+    assert fold("Mod", 17, 5) == 2
+    assert fold("Add", "ab", "cd") == "abcd"
+    assert fold("Pow", 2, 10) == 1024
+
+
+def test_huge_format_is_not_folded():
+    program, _ = optimize(generate_ir(parser('x = "%0300000000d" % 1\nprint(x)\n')))
+    assert all(instruction.opcode != LOAD_CONST or not isinstance(instruction.operand, str)
+               or len(instruction.operand) < MAX_FOLDED_SIZE for instruction in program)
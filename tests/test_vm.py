@@ -0,0 +1,95 @@
+import io
+import contextlib
+import pytest
+from parser_module import parser
+from ir_generator import generate_ir
+from optimizer import optimize
+from vm import supports, run_program
+from execution import WorkerPool
+
+# Programs the VM runs; each must print the same as Python itself
+PROGRAMS = [
+    "print(hex(255), oct(8), bin(5), format(3.14159, '.2f'), format(42, '>6'))\n",
+    "x = 3\ny = x * 4 + 2\nprint(y // 3, y % 5, -y, y ** 2, y / 4)\n",
+    "s = ''\nfor i in range(5):\n    s = s + str(i)\nprint(s, len(s), '%05d|' % 42)\n",
+    "def add(a, b):\n    return a + b\ndef twice(a):\n    return add(a, a)\nprint(twice(21))\n",
+    "def outer(a):\n    def inner(b):\n        return a + b\n    return inner(1)\nprint(outer(2))\n",
+    "n = 0\nwhile n < 10:\n    n = n + 3\n    if n == 6:\n        continue\n    print(n)\n",
+    "print(sorted(map(abs, range(-3, 2))), list(filter(bool, range(3))), sum(range(100)))\n",
+    "total = 0\nfor c in 'hello':\n    if c in 'aeiou':\n        total = total + ord(c)\nprint(total, divmod(17, 5))\n",
+    "print(1 < 2, 'a' * 3, 2 ** 10, 7 << 2, ~5, not 0)\n",
+]
+
+
+def exec_output(code):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        exec(compile(code, "<string>", "exec"), {"__name__": "__main__"})
+    return out.getvalue()
+
+
+def vm_program(code):
+    return optimize(generate_ir(parser(code)))[0]
+
+
+@pytest.mark.parametrize("code", PROGRAMS)
+def test_vm_and_optimizer_match_python(code):
+    program = vm_program(code)
+    assert supports(program)
+    result = run_program(program)
+    assert result.exit_code == 0, result.stderr
+    assert result.stdout == exec_output(code)
+
+
+@pytest.mark.parametrize("code", [
+    "def f(n):\n    if n == 0:\n        return 0\n    return 1 + f(n - 1)\nprint(f(400))\n",  # Deep recursion
+    "def a(n):\n    return b(n)\ndef b(n):\n    if n:\n        return a(n - 1)\n    return 0\nprint(a(5))\n",
+    "def f(x):\n    return x\nprint(list(map(f, [1])))\n",  # A function used as a value
+    "print(open)\n",  # A builtin the VM does not provide
+    "print(undefined)\n",
+    "print('a,b'.split(','))\n",
+    "def f():\n    z = undefined_name\n    return 1\nprint(f())\n",  # The dead store must keep its load
+])
+def test_programs_the_vm_cannot_run_like_python_are_not_supported(code):
+    assert not supports(vm_program(code))
+
+
+def test_dead_store_keeps_a_load_that_raises_name_error():
+    program = vm_program("x = y\ny = 1\nprint(y)\n")
+    result = run_program(program)
+    assert (result.exit_code, result.stdout) == (1, "")
+    assert "NameError" in result.stderr
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = WorkerPool(size=1, timeout=2)
+    yield pool
+    pool.close()
+
+
+def test_vm_runs_in_the_worker(pool):
+    code = "def f(n):\n    return n * 2\nprint(f(21))\n"
+    result = pool.run(vm_program(code))
+    assert (result.exit_code, result.stdout) == (0, "42\n")
+
+
+@pytest.mark.parametrize("code, output", [
+    ("s = 'a' * 20000000\nprint(len(s))\n", "20000000\n"),
+    ("x = 2 ** 20000000\nprint(x > 0)\n", "True\n"),
+    ("x = '%0300000d' % 1\nprint(len(x))\n", "300000\n"),
+])
+def test_vm_builds_values_as_large_as_python_does(pool, code, output):
+    result = pool.run(vm_program(code))
+    assert (result.exit_code, result.stdout) == (0, output)
+
+
+def test_runaway_growth_stops_at_the_worker_memory_limit(pool):
+    result = pool.run(vm_program("s = 'ab'\nwhile True:\n    s = s + s\n"))
+    assert result.exit_code != 0 and "MemoryError" in result.stderr
+
+
+def test_long_builtin_call_is_killed_at_the_timeout(pool):
+    result = pool.run(vm_program("print(sum(range(10 ** 12)))\n"), timeout=0.5)
+    assert result.timed_out
+    assert pool.run(vm_program("print(1)\n")).stdout == "1\n"  # The worker was replaced
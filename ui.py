@@ -1,7 +1,7 @@
 import tkinter as tk
-from tkinter import scrolledtext, messagebox, Menu, filedialog, simpledialog, ttk
-from features import CompilerFeatures
-import subprocess
+from tkinter import scrolledtext, messagebox, Menu, filedialog, ttk
+from features import CompilerFeatures, PROFILED_STAGES, IR_COLORS
+from output_view import VirtualOutput
 import os
 
 class PythonCompiler(CompilerFeatures):
@@ -11,6 +11,7 @@ class PythonCompiler(CompilerFeatures):
         self.root.title("Python Mini Compiler")
         self.root.geometry("1000x600")
         self.root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         self.font_family = "Courier New"
         self.font_size = 12
@@ -31,15 +32,33 @@ class PythonCompiler(CompilerFeatures):
         # Edit Menu
         self.edit_menu = Menu(self.menu_bar, tearoff=0)
         self.edit_menu.add_command(label="Find", command=self.find_text)
+        self.edit_menu.add_command(label="Find Next", command=self.find_next, accelerator="F3")
         self.edit_menu.add_command(label="Replace", command=self.replace_text)
+        self.edit_menu.add_separator()
+        self.edit_menu.add_checkbutton(label="Regular Expression", command=lambda: self.toggle_search_option("regex"))
+        self.edit_menu.add_checkbutton(label="Whole Word", command=lambda: self.toggle_search_option("whole_word"))
         self.menu_bar.add_cascade(label="Edit", menu=self.edit_menu)
         
         # Settings Menu
         self.settings_menu = Menu(self.menu_bar, tearoff=0)
         self.settings_menu.add_command(label="Environment Options", command=self.open_environment_settings)
         self.settings_menu.add_command(label="Toggle Dark Mode", command=self.toggle_theme)
+        self.settings_menu.add_checkbutton(label="Live Diagnostics", command=self.toggle_live_diagnostics)
         self.menu_bar.add_cascade(label="Settings", menu=self.settings_menu)
+
+        # Profiling Menu
+        self.profiling_menu = Menu(self.menu_bar, tearoff=0)
+        for stage in PROFILED_STAGES:
+            self.profiling_menu.add_checkbutton(label=f"cProfile {stage}", command=lambda stage=stage: self.toggle_cprofile(stage))
+        self.profiling_menu.add_separator()
+        self.profiling_menu.add_command(label="Show cProfile Stats", command=self.show_cprofile_stats)
+        self.profiling_menu.add_command(label="Export Trace", command=self.export_trace)
+        self.menu_bar.add_cascade(label="Profiling", menu=self.profiling_menu)
         
+        # Status Bar (per-stage progress of background runs)
+        self.status_bar = tk.Label(root, text="Ready", anchor=tk.W, relief=tk.SUNKEN)
+        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+
         # Layout Frames
         self.main_frame = tk.PanedWindow(root, orient=tk.HORIZONTAL)
         self.main_frame.pack(fill=tk.BOTH, expand=True)
@@ -63,20 +82,34 @@ class PythonCompiler(CompilerFeatures):
         self.text_area = scrolledtext.ScrolledText(self.editor_frame, wrap=tk.WORD, font=(self.font_family, self.font_size))
         self.text_area.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
         self.editor_frame.add(self.text_area, stretch="always")
+        self.text_area.config(yscrollcommand=self.on_text_scroll)  # Search matches are highlighted as they scroll into view
+        self.text_area.bind("<F3>", self.find_next)
+        self.text_area.bind("<<Modified>>", self.on_modified)
+
+        # Output Area, with the per-stage timings of the last run next to it
+        self.output_frame = tk.PanedWindow(self.editor_frame, orient=tk.HORIZONTAL)
+        self.editor_frame.add(self.output_frame, stretch="never")
+        self.output_area = scrolledtext.ScrolledText(self.output_frame, wrap=tk.WORD, height=10, state=tk.DISABLED)
+        self.output_frame.add(self.output_area, stretch="always")
+        self.output_view = VirtualOutput(self.output_area, IR_COLORS)
 
-        # Output Area
-        self.output_area = scrolledtext.ScrolledText(self.editor_frame, wrap=tk.WORD, height=10, state=tk.DISABLED)
-        self.editor_frame.add(self.output_area, stretch="never")
+        self.timing_panel = ttk.Treeview(self.output_frame, columns=("stage", "calls", "wall", "cpu", "allocations"),
+                                         show="headings", height=10)
+        for column, heading, width in (("stage", "Stage", 110), ("calls", "Calls", 45), ("wall", "Wall ms", 65),
+                                       ("cpu", "CPU ms", 65), ("allocations", "Allocs", 65)):
+            self.timing_panel.heading(column, text=heading)
+            self.timing_panel.column(column, width=width, anchor=tk.W if column == "stage" else tk.E)
+        self.output_frame.add(self.timing_panel, stretch="never")
         
     def open_file_from_folder(self, event):
         # Get the selected file from the folder list
         file_name = self.folder_list.get(self.folder_list.curselection())
         if file_name:
-            self.open_file(file_name)  # Use the existing open_file method to open the file
+            self.open_file(os.path.join(self.indexer.root, file_name))  # Use the existing open_file method to open the file
     
     def open_file(self, file_name=None):
-        # Check if there are unsaved changes
-        if self.text_area.get("1.0", tk.END) != "\n":
+        # Check if there are unsaved changes (without copying out a possibly huge buffer)
+        if self.text_area.compare("end-1c", "!=", "1.0"):
             response = messagebox.askyesnocancel("Unsaved Changes", "You have unsaved changes. Do you want to save them?")
             if response is None:  # Cancel was clicked
                 return
@@ -88,10 +121,7 @@ class PythonCompiler(CompilerFeatures):
             file_name = filedialog.askopenfilename(filetypes=[("Python files", "*.py")])
         if file_name:
             try:
-                with open(file_name, 'r') as file:
-                    content = file.read()
-                    self.text_area.delete(1.0, tk.END)  # Clear existing content
-                    self.text_area.insert(tk.END, content)  # Insert file content
+                self.load_file(file_name)  # Inserted in chunks as it is read
             except Exception as e:
                 messagebox.showerror("Error", f"Could not open file: {e}")
 
@@ -108,11 +138,17 @@ class PythonCompiler(CompilerFeatures):
         self.ir_button = tk.Button(self.button_frame, text="Intermediate Code", command=self.run_ir, bg='brown', fg='white')
         self.ir_button.pack(side=tk.LEFT, padx=5)
 
+        self.optimize_button = tk.Button(self.button_frame, text="Optimize", command=self.run_optimizer, bg='teal', fg='white')
+        self.optimize_button.pack(side=tk.LEFT, padx=5)
+
         self.run_code_button = tk.Button(self.button_frame, text="Run Code", command=self.run_code, bg='pink', fg='white')
         self.run_code_button.pack(side=tk.LEFT, padx=5)
 
         self.run_button = tk.Button(self.button_frame, text="Run All", command=self.run_all, bg='green', fg='white')
         self.run_button.pack(side=tk.LEFT, padx=5)
+
+        self.tests_button = tk.Button(self.button_frame, text="Run Tests", command=self.run_tests, bg='gray', fg='white')
+        self.tests_button.pack(side=tk.LEFT, padx=5)
     
     def open_environment_settings(self):
         settings_window = tk.Toplevel(self.root)
@@ -140,18 +176,25 @@ class PythonCompiler(CompilerFeatures):
     def open_folder(self):
         folder_selected = filedialog.askdirectory()
         if folder_selected:
-            self.folder_list.delete(0, tk.END)
-            for file in os.listdir(folder_selected):
-                if file.endswith(".py"):
-                    self.folder_list.insert(tk.END, file)
+            self.watch_folder(folder_selected)  # Listed (recursively) and pre-analyzed in the background
             self.folder_list.bind("<Double-1>", self.open_file_from_folder)
 
     
+    def on_close(self):
+        self.background.shutdown()  # Cancel any run still in flight
+        self.live_runner.shutdown()
+        self.live_checker.shutdown()
+        self.stop_loading()
+        self.indexer.stop()
+        self.saver.flush()  # Let queued saves reach the disk
+        self.root.destroy()
+
     def toggle_theme(self):
         if self.theme == "light":
             self.theme = "dark"
             self.text_area.config(bg="black", fg="white", insertbackground="white")
             self.output_area.config(bg="black", fg="white")
+            self.status_bar.config(bg="gray20", fg="white")
             self.folder_frame.config(bg="gray20")
             for button in self.button_frame.winfo_children():
                 button.config(bg="gray30", fg="white")
@@ -159,6 +202,7 @@ class PythonCompiler(CompilerFeatures):
             self.theme = "light"
             self.text_area.config(bg="white", fg="black", insertbackground="black")
             self.output_area.config(bg="white", fg="black")
+            self.status_bar.config(bg="SystemButtonFace", fg="black")
             self.folder_frame.config(bg="lightgray")
             for button in self.button_frame.winfo_children():
                 button.config(bg="SystemButtonFace", fg="black")
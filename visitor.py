@@ -0,0 +1,135 @@
+import ast
+
+
+class AnalysisPass:
+    """Base class for passes driven by FusedVisitor.
+
+    Like ast.NodeVisitor, methods named visit_<NodeType> are called when a
+    node of that type is entered and leave_<NodeType> once all of its
+    children have been visited. A handler for a base class such as ast.expr
+    covers the subclasses the pass has no handler for. after_<NodeType>_<field> is called once the
+    children in that field have been visited, e.g. after_If_test runs
+    between an if statement's condition and its body. finish() returns the
+    pass result.
+    """
+
+    _handler_names = {}  # (pass class, prefix) -> {node type: method name, or {field: method name} for after_}
+
+    def handler_names(self, prefix):
+        key = (type(self), prefix)
+        names = AnalysisPass._handler_names.get(key)
+        if names is None:
+            names = {}
+            for name in dir(self):
+                if name.startswith(prefix):
+                    node_type = getattr(ast, name[len(prefix):], None)
+                    if isinstance(node_type, type):
+                        names[node_type] = name
+            # visit_expr, visit_stmt, ... cover every subclass without a closer handler
+            for base, name in sorted(names.items(), key=lambda item: -len(item[0].__mro__)):
+                subclasses = base.__subclasses__()
+                while subclasses:
+                    node_type = subclasses.pop()
+                    subclasses.extend(node_type.__subclasses__())
+                    names.setdefault(node_type, name)
+            AnalysisPass._handler_names[key] = names
+        return names
+
+    def field_handler_names(self):
+        key = (type(self), "after_")
+        names = AnalysisPass._handler_names.get(key)
+        if names is None:
+            names = {}  # node type -> {field: method name}
+            for name in dir(self):
+                if name.startswith("after_"):
+                    type_name, _, field = name[len("after_"):].partition("_")
+                    node_type = getattr(ast, type_name, None)
+                    if isinstance(node_type, type) and field in node_type._fields:
+                        names.setdefault(node_type, {})[field] = name
+            AnalysisPass._handler_names[key] = names
+        return names
+
+    def finish(self):
+        return None
+
+
+class FusedVisitor:
+    """Walks a tree once and dispatches every node to all registered passes."""
+
+    # tuple of pass classes -> (enter, leave, fields); handlers are (function, pass index) pairs so the
+    # tables can be shared by every FusedVisitor over the same kinds of pass, e.g. one per chunk
+    _layouts = {}
+
+    def __init__(self, passes):
+        self.passes = passes
+        key = tuple(type(analysis_pass) for analysis_pass in passes)
+        layout = FusedVisitor._layouts.get(key)
+        if layout is None:
+            layout = FusedVisitor._layouts[key] = self._layout(passes)
+        # node type -> handlers called before children, after children, and {field: handlers} after a field's
+        # children; plans holds what walk needs per node type, built from those on first sight
+        self.enter, self.leave, self.fields, self.plans = layout
+
+    @staticmethod
+    def _layout(passes):
+        enter, leave, fields = {}, {}, {}
+        for index, analysis_pass in enumerate(passes):
+            cls = type(analysis_pass)
+            for node_type, name in analysis_pass.handler_names("visit_").items():
+                enter.setdefault(node_type, []).append((getattr(cls, name), index))
+            for node_type, name in analysis_pass.handler_names("leave_").items():
+                leave.setdefault(node_type, []).append((getattr(cls, name), index))
+            for node_type, hooks in analysis_pass.field_handler_names().items():
+                for field, name in hooks.items():
+                    fields.setdefault(node_type, {}).setdefault(field, []).append((getattr(cls, name), index))
+        return enter, leave, fields, {}
+
+    def _plan(self, node_type):
+        # (enter handlers, leave handlers, ((field, after_ handlers), ...) in reverse field order), so walk
+        # needs a single lookup per node instead of one per table and ast.iter_fields
+        hooks = self.fields.get(node_type, {})
+        plan = (tuple(self.enter.get(node_type, ())), tuple(self.leave.get(node_type, ())),
+                tuple((field, tuple(hooks.get(field, ()))) for field in reversed(node_type._fields)))
+        self.plans[node_type] = plan
+        return plan
+
+    def walk(self, tree):
+        # Iterative pre/post-order walk so deeply nested code cannot hit the recursion limit. The stack
+        # holds nodes still to enter and (handlers, node) pairs for leave_ and after_ handlers.
+        passes, plans, AST = self.passes, self.plans, ast.AST
+        stack = [tree]
+        pop, push = stack.pop, stack.append
+        while stack:
+            node = pop()
+            if type(node) is tuple:
+                handlers, node = node
+                for function, index in handlers:
+                    function(passes[index], node)
+                continue
+
+            plan = plans.get(type(node))
+            if plan is None:
+                plan = self._plan(type(node))
+            enter, leave, fields = plan
+            for function, index in enter:
+                function(passes[index], node)
+            if leave:
+                push((leave, node))
+            for field, hooks in fields:
+                if hooks:
+                    push((hooks, node))
+                value = getattr(node, field, None)
+                if type(value) is list:
+                    for item in reversed(value):
+                        if isinstance(item, AST):
+                            push(item)
+                elif isinstance(value, AST):
+                    push(value)
+
+    def visit(self, tree):
+        self.walk(tree)
+        return [analysis_pass.finish() for analysis_pass in self.passes]
+
+
+def run_passes(tree, passes):
+    return FusedVisitor(passes).visit(tree)
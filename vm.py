@@ -0,0 +1,376 @@
+import io
+import time
+import operator
+from collections import Counter
+from execution import ExecutionResult, OutputBuffer, DEFAULT_TIMEOUT
+from operators import BINARY_OPERATORS, UNARY_OPERATORS, COMPARE_OPERATORS
+from ir_generator import (OPCODES, STORE, LOAD_CONST, LOAD_VAR, BINARY_OP, CALL, IF_START, JUMP, RETURN,
+                          FUNCTION, POP, DUP, UNARY_OP, COMPARE, GET_ITER, FOR_ITER, EVAL, BEGIN, END,
+                          STORE_GLOBAL, LOAD_GLOBAL, LOAD_FREE)
+
+CHECK_EVERY = 1024  # Instructions between checks of the deadline and cancellation
+
+UNSUPPORTED = {EVAL, BEGIN, END}  # Code the IR does not model, so the VM cannot run it
+STREAM_BUILTINS = {"print", "input"}  # Builtins each VirtualMachine binds to its own streams
+_USES = {CALL, LOAD_VAR, LOAD_GLOBAL, LOAD_FREE}  # Instructions whose operand is a name that must exist
+
+COMPARE_OPERATORS = dict(COMPARE_OPERATORS, Is=operator.is_, IsNot=operator.is_not)
+
+
+class VMError(Exception):
+    pass
+
+
+class _TimedOut(BaseException):
+    pass
+
+
+class _Cancelled(BaseException):
+    pass
+
+
+def supports(program):
+    """True if the VM runs program as Python would.
+
+    Every instruction must be one the VM models and every name read or
+    called must be bound by the program or be one of the VM's builtins.
+    Functions must not be able to recurse: calls nest on the Python stack,
+    so the VM reaches the recursion limit long before Python would. Calls go
+    by name, so no function may be used as a value (e.g. passed to map())
+    and the graph of calls between functions must have no cycle.
+    """
+    if UNSUPPORTED.intersection(program.opcodes):
+        return False
+    code = list(program)
+    available = ({instruction.operand for instruction in code if instruction.opcode in (STORE, STORE_GLOBAL, FUNCTION)}
+                 | SAFE_BUILTINS.keys() | STREAM_BUILTINS)
+    calls = {}  # Function name -> names used in its body, including in functions nested in it
+    for index, instruction in enumerate(code):
+        if instruction.opcode in _USES and instruction.operand not in available:
+            return False  # Undefined, a missing builtin or a call such as f()() the VM cannot look up
+        if instruction.opcode == FUNCTION:
+            end = code[index + 1].operand  # The JUMP over the body
+            calls.setdefault(instruction.operand, set()).update(
+                other.operand for other in code[index + 2:end] if other.opcode in _USES)
+    if any(instruction.opcode != CALL and instruction.operand in calls
+           for instruction in code if instruction.opcode in _USES):
+        return False
+
+    # Depth-first search for a cycle; state is 1 while a function is on the path, 2 once it is done
+    state = {}
+    for root in calls:
+        if root in state:
+            continue
+        state[root] = 1
+        stack = [(root, iter(calls[root] & calls.keys()))]
+        while stack:
+            name, callees = stack[-1]
+            callee = next(callees, None)
+            if callee is None:
+                state[name] = 2
+                stack.pop()
+            elif state.get(callee) == 1:
+                return False
+            elif callee not in state:
+                state[callee] = 1
+                stack.append((callee, iter(calls[callee] & calls.keys())))
+    return True
+
+
+SAFE_BUILTINS = {
+    "len": len, "range": range, "int": int, "str": str, "float": float, "bool": bool,
+    "list": list, "dict": dict, "set": set, "tuple": tuple, "frozenset": frozenset, "sorted": sorted,
+    "reversed": reversed, "enumerate": enumerate,
+    "zip": zip, "map": map, "filter": filter, "iter": iter, "next": next,
+    "abs": abs, "min": min, "max": max, "sum": sum, "round": round, "divmod": divmod, "pow": pow,
+    "any": any, "all": all, "chr": chr, "ord": ord, "hex": hex, "oct": oct, "bin": bin, "format": format,
+    "repr": repr, "ascii": ascii, "hash": hash, "callable": callable, "type": type, "isinstance": isinstance,
+}
+
+
+class VMFunction:
+    """A function defined by a FUNCTION instruction."""
+
+    __slots__ = ("vm", "name", "entry", "param_count", "closure")
+
+    def __init__(self, vm, name, entry, param_count, closure=()):
+        self.vm = vm
+        self.name = name
+        self.entry = entry  # Index of the first instruction of the body
+        self.param_count = param_count
+        self.closure = closure  # Variables of the enclosing function calls, innermost first
+
+    def __call__(self, *args):  # Lets builtins such as map() call it
+        return self.vm.call(self, args)
+
+    def __repr__(self):
+        return f"<function {self.name}>"
+
+
+class Frame:
+    __slots__ = ("stack", "variables", "closure", "result")
+
+    def __init__(self, variables, stack=None, closure=()):
+        self.stack = stack if stack is not None else []
+        self.variables = variables
+        self.closure = closure
+        self.result = None
+
+
+class VirtualMachine:
+    """Stack machine that executes an IRProgram in-process.
+
+    The program is decoded once into a list of (opcode, operand, argcount)
+    tuples whose operands are ready to use (constants, names, jump targets,
+    operator functions), and the main loop dispatches each instruction
+    through a table of handlers indexed by opcode. Programs only see the
+    names in SAFE_BUILTINS, and their runs are limited by a deadline
+    (none if timeout is None, e.g. in a WorkerPool worker, whose parent
+    enforces it) and a cancellation event. Like Python itself, the VM puts
+    no cap on the size of values; the worker's address space limit does.
+    """
+
+    def __init__(self, program, stdin="", on_output=None, max_output_lines=None, timeout=DEFAULT_TIMEOUT,
+                 cancel=None, profile=False):
+        unsupported = sorted({OPCODES[opcode] for opcode in UNSUPPORTED.intersection(program.opcodes)})
+        if unsupported:
+            raise VMError(f"program uses code the VM cannot run ({', '.join(unsupported)})")
+        self.code = self.precompile(program)
+        self.dispatch = [None] * len(OPCODES)
+        for opcode, handler in ((STORE, self.op_store), (LOAD_CONST, self.op_load_const),
+                                (LOAD_VAR, self.op_load_var), (BINARY_OP, self.op_binary_op),
+                                (CALL, self.op_call), (IF_START, self.op_if_start), (JUMP, self.op_jump),
+                                (RETURN, self.op_return), (FUNCTION, self.op_function), (POP, self.op_pop),
+                                (DUP, self.op_dup), (UNARY_OP, self.op_unary_op), (COMPARE, self.op_compare),
+                                (GET_ITER, self.op_get_iter), (FOR_ITER, self.op_for_iter),
+                                (STORE_GLOBAL, self.op_store_global), (LOAD_GLOBAL, self.op_load_global),
+                                (LOAD_FREE, self.op_load_free)):
+            self.dispatch[opcode] = handler
+
+        self.output = {"stdout": OutputBuffer(max_output_lines), "stderr": OutputBuffer(max_output_lines)}
+        self.on_output = on_output
+        self.stdin = io.StringIO(stdin)
+        self.builtins = dict(SAFE_BUILTINS, print=self.builtin_print, input=self.builtin_input)
+        self.globals = {}
+        self.timeout = timeout
+        self.cancel = cancel
+        self.deadline = None
+        self.steps = 0
+        self.counts = Counter() if profile else None  # Instruction index -> times executed
+
+    @staticmethod
+    def precompile(program):
+        code = []
+        for instruction in program:
+            opcode, operand = instruction.opcode, instruction.operand
+            if opcode == BINARY_OP:
+                operand = BINARY_OPERATORS[operand]
+            elif opcode == UNARY_OP:
+                operand = UNARY_OPERATORS[operand]
+            elif opcode == COMPARE:
+                operand = COMPARE_OPERATORS[operand]
+            code.append((opcode, operand, instruction.argcount))
+        code.append((RETURN, None, 0))  # Falling off the end returns from the module
+        return code
+
+    # Instruction handlers take the frame, operand and argcount and return the next instruction index
+    def op_store(self, frame, name, argcount, pc):
+        frame.variables[name] = frame.stack.pop()
+        return pc
+
+    def op_load_const(self, frame, value, argcount, pc):
+        frame.stack.append(value)
+        return pc
+
+    def op_store_global(self, frame, name, argcount, pc):
+        self.globals[name] = frame.stack.pop()
+        return pc
+
+    def op_load_var(self, frame, name, argcount, pc):
+        variables = frame.variables
+        if name in variables:
+            frame.stack.append(variables[name])
+        elif variables is self.globals:  # Module code also sees the builtins
+            frame.stack.append(self.lookup(frame, name))
+        else:
+            raise UnboundLocalError(f"cannot access local variable '{name}' where it is not associated with a value")
+        return pc
+
+    def op_load_global(self, frame, name, argcount, pc):
+        if name in self.globals:
+            frame.stack.append(self.globals[name])
+        elif name in self.builtins:
+            frame.stack.append(self.builtins[name])
+        else:
+            raise NameError(f"name '{name}' is not defined")
+        return pc
+
+    def op_load_free(self, frame, name, argcount, pc):
+        for variables in frame.closure:
+            if name in variables:
+                frame.stack.append(variables[name])
+                return pc
+        raise NameError(f"cannot access free variable '{name}' where it is not associated with a value "
+                        f"in enclosing scope")
+
+    def op_binary_op(self, frame, function, argcount, pc):
+        right = frame.stack.pop()
+        frame.stack[-1] = function(frame.stack[-1], right)
+        return pc
+
+    def op_unary_op(self, frame, function, argcount, pc):
+        frame.stack[-1] = function(frame.stack[-1])
+        return pc
+
+    def op_compare(self, frame, function, argcount, pc):
+        right = frame.stack.pop()
+        frame.stack[-1] = function(frame.stack[-1], right)
+        return pc
+
+    def op_call(self, frame, name, argcount, pc):
+        stack = frame.stack
+        args = stack[len(stack) - argcount:]
+        del stack[len(stack) - argcount:]
+        function = self.lookup(frame, name)
+        if type(function) is VMFunction:
+            stack.append(self.call(function, args))
+        else:
+            stack.append(function(*args))
+        return pc
+
+    def op_if_start(self, frame, target, argcount, pc):
+        return pc if frame.stack.pop() else target
+
+    def op_jump(self, frame, target, argcount, pc):
+        return target
+
+    def op_return(self, frame, operand, argcount, pc):
+        frame.result = frame.stack.pop() if frame.stack else None
+        return None
+
+    def op_function(self, frame, name, param_count, pc):
+        # Functions defined in a function read its variables (and those it can read) when they run
+        closure = () if frame.variables is self.globals else (frame.variables, *frame.closure)
+        frame.variables[name] = VMFunction(self, name, pc + 1, param_count, closure)  # Body starts after the JUMP over it
+        return pc
+
+    def op_pop(self, frame, operand, argcount, pc):
+        frame.stack.pop()
+        return pc
+
+    def op_dup(self, frame, operand, argcount, pc):
+        frame.stack.append(frame.stack[-1])
+        return pc
+
+    def op_get_iter(self, frame, operand, argcount, pc):
+        frame.stack[-1] = iter(frame.stack[-1])
+        return pc
+
+    def op_for_iter(self, frame, target, argcount, pc):
+        try:
+            frame.stack.append(next(frame.stack[-1]))
+        except StopIteration:
+            frame.stack.pop()
+            return target
+        return pc
+
+    def lookup(self, frame, name):
+        for scope in (frame.variables, *frame.closure, self.globals, self.builtins):
+            if name in scope:
+                return scope[name]
+        raise NameError(f"name '{name}' is not defined")
+
+    def call(self, function, args):
+        if len(args) != function.param_count:
+            raise TypeError(f"{function.name}() takes {function.param_count} positional arguments "
+                            f"but {len(args)} were given")
+        frame = Frame({}, list(args), function.closure)  # The body starts by storing its parameters from the stack
+        self.execute(function.entry, frame)
+        return frame.result
+
+    def execute(self, pc, frame):
+        code, dispatch, counts = self.code, self.dispatch, self.counts
+        steps = 0
+        try:
+            while pc is not None:
+                opcode, operand, argcount = code[pc]
+                if counts is not None:
+                    counts[pc] += 1
+                pc = dispatch[opcode](frame, operand, argcount, pc + 1)
+                steps += 1
+                if steps == CHECK_EVERY:
+                    self.check()
+                    self.steps += steps
+                    steps = 0
+        finally:
+            self.steps += steps
+
+    def check(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise _Cancelled()
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise _TimedOut()
+
+    # Builtins that talk to the program's streams
+    def write(self, stream, text):
+        self.output[stream].write(stream, text)
+        if self.on_output:
+            self.on_output(stream, text)
+
+    def builtin_print(self, *values):
+        self.write("stdout", " ".join(map(str, values)) + "\n")
+
+    def builtin_input(self, prompt=""):
+        if prompt:
+            self.write("stdout", str(prompt))
+        line = self.stdin.readline()
+        if not line:
+            raise EOFError("EOF when reading a line")
+        return line.rstrip("\n")
+
+    def run(self):
+        """Execute the program from the start and return an ExecutionResult."""
+        exit_code = 0
+        timed_out = False
+        start = time.perf_counter()
+        self.deadline = start + self.timeout if self.timeout is not None else None
+        try:
+            self.execute(0, Frame(self.globals))
+        except _TimedOut:
+            timed_out = True
+            exit_code = None
+        except _Cancelled:
+            self.write("stderr", "Execution cancelled")
+            exit_code = None
+        except RecursionError:
+            self.write("stderr", "RecursionError: maximum recursion depth exceeded\n")
+            exit_code = 1
+        except Exception as e:
+            self.write("stderr", "".join([type(e).__name__, f": {e}" if str(e) else "", "\n"]))
+            exit_code = 1
+        duration = time.perf_counter() - start
+        return ExecutionResult(self.output["stdout"].text("stdout"), self.output["stderr"].text("stderr"),
+                               exit_code, timed_out, duration)
+
+    def profile_report(self, top=10):
+        """Text summary of the instructions executed, by opcode and hottest instruction."""
+        if self.counts is None:
+            return "Profiling was not enabled"
+        by_opcode = Counter()
+        for pc, count in self.counts.items():
+            by_opcode[OPCODES[self.code[pc][0]]] += count
+        total = sum(by_opcode.values())
+        lines = [f"Instructions executed: {total}"]
+        for name, count in by_opcode.most_common():
+            lines.append(f"  {name:<12}{count:>12}{count / total * 100:>8.1f}%")
+        lines.append("Hottest instructions:")
+        for pc, count in self.counts.most_common(top):
+            opcode, operand, argcount = self.code[pc]
+            operand = getattr(operand, "__name__", operand)
+            lines.append(f"  {pc:>6}  {OPCODES[opcode]} {'' if operand is None else operand}".rstrip() + f"  x{count}")
+        return "\n".join(lines)
+
+
+def run_program(program, **options):
+    """Execute program on a new VirtualMachine; options are passed to its constructor."""
+    return VirtualMachine(program, **options).run()